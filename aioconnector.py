@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#
+# asyncio-based versions of the server and client connectors.  These keep
+# the INIT/CALL/RESULT/HB/CLOSE handling of ServerConnector/ClientConnector
+# and only replace the transport layer: every connection gets its own
+# protocol instance with a framed reader and a write queue that respects
+# transport backpressure, so one slow endpoint never blocks the others.
+#
+
+import asyncio
+import collections
+import multiprocessing as mp
+
+import measurements_pb2 as measpb
+from framing import FrameReader, pack_frame
+from serverconnector import ServerConnector
+from clientconnector import ClientConnector
+
+
+class ConnProtocol(asyncio.Protocol):
+    # Queued bytes beyond which an endpoint is considered stuck and dropped.
+    MAX_QUEUED = 256 * 1024 * 1024
+
+    def __init__(self, connector):
+        self.connector = connector
+        self.transport = None
+        self.peerinfo = None
+        self.fd = -1
+        self.reader = FrameReader()
+        self.wqueue = collections.deque()
+        self.queued = 0
+        self.paused = False
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peerinfo = transport.get_extra_info('peername')[:2]
+        self.fd = transport.get_extra_info('socket').fileno()
+        self.connector._conn_made(self)
+
+    def data_received(self, data):
+        self.reader.feed(data)
+        for msg in self.reader.get_messages():
+            self.connector.DISPATCH[msg.type](self.connector, msg, self)
+            if self.transport.is_closing():
+                break
+
+    def connection_lost(self, exc):
+        self.wqueue.clear()
+        self.connector._conn_lost(self)
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self._flush()
+
+    def write(self, frame):
+        if self.transport.is_closing():
+            return
+        self.wqueue.append(frame)
+        self.queued += len(frame)
+        if self.queued > self.MAX_QUEUED:
+            self.connector.logger.warning(
+                "Dropping %s:%s: too much data queued." % self.peerinfo)
+            self.transport.abort()
+            return
+        self._flush()
+
+    def _flush(self):
+        # The transport calls pause_writing() from inside write() once its
+        # buffer passes the high-water mark; stop there and let
+        # resume_writing() pick up the rest.
+        while self.wqueue and not self.paused:
+            frame = self.wqueue.popleft()
+            self.queued -= len(frame)
+            self.transport.write(frame)
+
+    def getpeername(self):
+        return self.peerinfo
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncServerConnector(ServerConnector):
+    BACKLOG = 1024
+
+    def _conn_made(self, proto):
+        (ip, port) = proto.peerinfo
+        if not self._valid_ip(ip):
+            self.logger.info("Rejected connection from %s" % ip)
+            proto.transport.abort()
+            return
+        self.logger.info("Accepted connection: %s:%s" % (ip, port))
+
+    def _conn_lost(self, proto):
+        if self.clients.remove(proto.fd):
+            self.logger.warning("Connection to %s:%s closed unexpectedly." %
+                                proto.peerinfo)
+
+    def _close_conn(self, conn):
+        self.clients.remove(conn.fd)
+        conn.close()
+
+    def _queue_frame(self, conn, frame):
+        conn.write(frame)
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.pipe.fileno(), self._readpipe, self.pipe, None)
+        server = await loop.create_server(lambda: ConnProtocol(self),
+                                          self.LISTEN_IP, self.LISTEN_PORT,
+                                          backlog=self.BACKLOG,
+                                          reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, pipe, logger):
+        self.pipe = pipe
+        self.logger = logger
+        asyncio.run(self._serve())
+
+
+class AsyncClientConnector(ClientConnector):
+
+    def _conn_made(self, proto):
+        pass
+
+    def _conn_lost(self, proto):
+        pass
+
+    def _send_msg(self, conn, msg):
+        if isinstance(conn, mp.connection.Connection):
+            conn.send(msg.SerializeToString())
+        else:
+            conn.write(pack_frame(msg))
+
+    def _send_frame(self, frame):
+        if self.sock:
+            self.sock.write(frame)
+
+    async def _aconnect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                (trans, proto) = await loop.create_connection(
+                    lambda: ConnProtocol(self), self.srvip, self.srvport)
+                self.tries = 0
+                return proto
+            except OSError as e:
+                delay = self._backoff()
+                self.logger.warning("Failed to connect to %s:%s: %s (retry in %.1fs)"
+                                    % (self.srvip, self.srvport, e, delay))
+                await asyncio.sleep(delay)
+
+    async def _session(self):
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.pipe.fileno(), self._readpipe, self.pipe, None)
+        while True:
+            self.sock = await self._aconnect()
+            self._send_frame(pack_frame(self._mk_init()))
+            await self.sock.closed
+            self.sock = None
+            self.logger.warning("Connection to %s:%s closed unexpectedly." %
+                                (self.srvip, self.srvport))
+            await asyncio.sleep(self._backoff())
+
+    def run(self, pipe, logger):
+        self.pipe = pipe
+        self.logger = logger
+        self._open_spool()
+        asyncio.run(self._session())
@@ -17,6 +17,7 @@ DEF_DFNAME="measurements.hdf5"
 MEAS_ROOT="measure_paths"
 STATIC_ROOT="static_data"
 DEF_FILTBW = 1e4
+DEF_NFFT = 256
 
 RATTRS = "_RUN_ATTRS"
 DATA = "_DATA"
@@ -47,35 +48,61 @@ class TimestampRange:
         self.min = int(tmin)
         self.max = int(tmax)
 
-def calc_powerdiffs_from_samples(attrs, ds, filtbw):
+def calc_powerdiffs_from_samples(attrs, ds, filtbw, method = 'butter'):
     rate = attrs['rate']
     fstep = attrs['freq_step']
     steps = int(np.floor(rate/fstep/2))
     nsamps = attrs['nsamps']
     foff = filtbw/2
-    pwrs = []
-    for i in range(1,steps):
-        bsamps = np.array(ds[0][(i-1)*nsamps:i*nsamps])
-        tsamps = np.array(ds[1][(i-1)*nsamps:i*nsamps])
-        fbsamps = butter_filt(bsamps, i*fstep - foff,
-                              i*fstep + foff, rate)
-        ftsamps = butter_filt(tsamps, i*fstep - foff,
-                              i*fstep + foff, rate)
-        pwrs.append(get_avg_power(ftsamps) - get_avg_power(fbsamps))
-    return np.array(pwrs)
+    reduce = attrs.get('reduce', '')
+    if reduce:
+        # Clients summarized each step in sub-bands of filter_bw.
+        nbands = band_count(rate, attrs.get('filter_bw', DEF_FILTBW))
+        nsamps = nsamps // nbands if reduce == 'iq' else nbands
+    # Baseline and transmit segments of every step, one per row, with
+    # their tone's band; filtered and measured in one go.
+    segs = np.array(ds[:, :(steps-1)*nsamps]).reshape(2*(steps-1), nsamps)
+    tones = [i*fstep for i in range(1,steps)] * 2
+    if reduce in ('bands', 'psd'):
+        pwrs = segs[np.arange(len(tones)),
+                    [band_index(tone, nbands, rate) for tone in tones]]
+    elif reduce == 'iq':
+        pwrs = get_avg_power(segs, axis=-1)
+    elif method == 'fft':
+        pwrs = tone_powers(segs, tones, filtbw, rate)
+    else:
+        bands = [(tone - foff, tone + foff) for tone in tones]
+        pwrs = get_avg_power(filter_bank(segs, bands, rate), axis=-1)
+    return pwrs[steps-1:] - pwrs[:steps-1]
 
-def do_psd_plots(attrs, name, allsamps):
+def do_psd_plots(attrs, name, allsamps, nfft = DEF_NFFT):
     rate = attrs['rate']
     fstep = attrs['freq_step']
     steps = int(np.floor(rate/fstep/2))
     nsamps = attrs['nsamps']
+    reduce = attrs.get('reduce', '')
+    if reduce:
+        nbands = band_count(rate, attrs.get('filter_bw', DEF_FILTBW))
+    if reduce in ('bands', 'psd'):
+        # Already one value per sub-band.
+        (nsamps, nfft) = (nbands, nbands)
+        segs = np.asarray(allsamps[:(steps-1)*nsamps]).reshape(steps-1,
+                                                               nsamps)
+        psds = segs
+    else:
+        if reduce == 'iq':
+            # The tone's sub-band only, at the decimated rate.
+            (nsamps, rate) = (nsamps // nbands, rate / nbands)
+        nfft = min(nfft, nsamps)
+        # Welch PSDs of all steps in one pass.
+        segs = np.asarray(allsamps[:(steps-1)*nsamps]).reshape(steps-1,
+                                                               nsamps)
+        psds = welch_psd(segs, nfft, rate)
+    freqs = np.fft.fftshift(np.fft.fftfreq(nfft, 1/rate))
     for i in range(1,steps):
-        tsamps = allsamps[(i-1)*nsamps:i*nsamps]
-        psd = compute_psd(nsamps, tsamps)
-        freqs = np.fft.fftshift(np.fft.fftfreq(nsamps, 1/rate))
         title = "%s-%f" % (name, i*fstep)
         plproc = mp.Process(target=plot_stuff,
-                            args=(title, freqs, psd))
+                            args=(title, freqs, psds[i-1]))
         plproc.start()
 
 def search_entries(filters, results, name, obj):
@@ -117,7 +144,8 @@ def calc_measdiffs(objs, args):
         ent[RXNAME] = obj.name.split('/')[-1]
         if args.usesamps:
             ent[DATA] = calc_powerdiffs_from_samples(run.attrs, obj['samples'],
-                                                     args.filtbw)
+                                                     args.filtbw,
+                                                     args.powermethod)
         else:
             ent[DATA] = obj['avgpower'][1] - obj['avgpower'][0]
         diffs.append(ent)
@@ -238,7 +266,7 @@ def main(args):
             exit(1)
         run = dsfile[MEAS_ROOT][args.runstamp]
         samps = run[args.txname][args.rxname]['samples'][1]
-        do_psd_plots(run.attrs, args.rxname, samps)
+        do_psd_plots(run.attrs, args.rxname, samps, args.nfft)
 
 def parse_args():
     """Parse the command line arguments"""
@@ -253,6 +281,8 @@ def parse_args():
     parser.add_argument("-t", "--runstamp", type=str, default=0, help="Limit to entries logged at a specific unix timestamp.")
     parser.add_argument("-r", "--timerange", type=str, default="", help="Search for entries in a time range define by two unix timestamps separated by commas (e.g. 1602005000,1602006000).")
     parser.add_argument("-b", "--filtbw", type=float, default=DEF_FILTBW, help="Bandpass filter bandwidth for calculating average power for carrier wave transmissions. Default: %f" % DEF_FILTBW)
+    parser.add_argument("--powermethod", choices=["butter", "fft"], default="butter", help="How to calculate tone power from samples: Butterworth bandpass filter, or FFT bins (faster; see sigutils.tone_powers for tolerance). Default: butter")
+    parser.add_argument("--nfft", type=int, default=DEF_NFFT, help="FFT size for (Welch averaged) PSD plots. Default: %d" % DEF_NFFT)
     parser.add_argument("-s", "--usesamps", action="store_true", help="Use stored samples (if they exist) to calculate the requested data.")
     return parser.parse_args()
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+#
+# Connector throughput benchmark: selector-based ServerConnector versus
+# AsyncServerConnector, driven by simulated measurement clients.
+#
+
+import time
+import asyncio
+import argparse
+import multiprocessing as mp
+
+import measurements_pb2 as measpb
+from rpccalls import *
+from framing import FrameReader, pack_frame
+from serverconnector import ServerConnector
+from aioconnector import AsyncServerConnector
+
+ENGINES = {
+    'selector': ServerConnector,
+    'asyncio': AsyncServerConnector,
+}
+
+class SimClientProtocol(asyncio.Protocol):
+    """Answers every CALL with a RESULT carrying `payload` bytes."""
+    def __init__(self, name, result):
+        self.name = name
+        self.result = result
+        self.reader = FrameReader()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        msg = measpb.SessionMsg()
+        msg.type = measpb.SessionMsg.INIT
+        msg.clientname = self.name
+        transport.write(pack_frame(msg))
+
+    def data_received(self, data):
+        self.reader.feed(data)
+        for msg in self.reader.get_messages():
+            if msg.type == measpb.SessionMsg.CALL:
+                self.transport.write(self.result)
+
+def run_sim_clients(port, first, count, payload):
+    async def sim():
+        loop = asyncio.get_running_loop()
+        for i in range(first, first + count):
+            rmsg = measpb.SessionMsg()
+            rmsg.type = measpb.SessionMsg.RESULT
+            rmsg.clientname = "sim%d" % i
+            rmsg.sample_data = bytes(payload)
+            await loop.create_connection(
+                lambda: SimClientProtocol("sim%d" % i, pack_frame(rmsg)),
+                "127.0.0.1", port)
+        await asyncio.Event().wait()
+    asyncio.run(sim())
+
+def get_clients(pipe):
+    cmsg = measpb.SessionMsg()
+    cmsg.type = measpb.SessionMsg.CALL
+    cmsg.funcname = ServerConnector.CALL_GETCLIENTS
+    pipe.send(cmsg.SerializeToString())
+    rmsg = measpb.SessionMsg()
+    rmsg.ParseFromString(pipe.recv())
+    return rmsg.clients
+
+def bench(engine, args):
+    logger = mp.get_logger()
+    conn = ENGINES[engine]()
+    conn.LISTEN_PORT = args.port
+    (c1, c2) = mp.Pipe()
+    srvproc = mp.Process(target=conn.run, args=(c2, logger), daemon=True)
+    srvproc.start()
+    time.sleep(0.5)
+
+    simprocs = []
+    per = -(-args.clients // args.procs)
+    for first in range(0, args.clients, per):
+        count = min(per, args.clients - first)
+        proc = mp.Process(target=run_sim_clients, daemon=True,
+                          args=(args.port, first, count, args.payload))
+        proc.start()
+        simprocs.append(proc)
+    while len(get_clients(c1)) < args.clients:
+        time.sleep(0.2)
+
+    cmsg = RPCCALLS['rxsamples'].encode(nsamps=256)
+    cmsg.clients.append("all")
+    scall = cmsg.SerializeToString()
+    nres = 0
+    nbytes = 0
+    stime = time.time()
+    for i in range(args.rounds):
+        c1.send(scall)
+        for j in range(args.clients):
+            rmsg = measpb.SessionMsg()
+            rmsg.ParseFromString(c1.recv())
+            nres += 1
+            nbytes += len(rmsg.sample_data)
+    elapsed = time.time() - stime
+
+    for proc in [srvproc] + simprocs:
+        proc.terminate()
+        proc.join()
+    print("%-8s clients=%d rounds=%d: %.0f results/s, %.1f MB/s of RESULT data"
+          % (engine, args.clients, args.rounds, nres/elapsed,
+             nbytes/elapsed/1e6))
+
+def parse_args():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-e", "--engine", choices=list(ENGINES) + ['both'], default='both')
+    parser.add_argument("-c", "--clients", type=int, default=200)
+    parser.add_argument("-n", "--rounds", type=int, default=50)
+    parser.add_argument("-s", "--payload", type=int, default=8192, help="RESULT payload size in bytes")
+    parser.add_argument("-j", "--procs", type=int, default=4, help="Processes used to host simulated clients")
+    parser.add_argument("-p", "--port", type=int, default=5599)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    engines = list(ENGINES) if args.engine == 'both' else [args.engine]
+    for engine in engines:
+        bench(engine, args)
+        args.port += 1
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+#
+# Per-tone power of a measure_paths sweep (baseline and transmit rows of
+# one link), as analyze-data.py computes it: the original per-step
+# Butterworth loop, the batched filter bank, and the single-FFT estimator.
+#
+
+import time
+import argparse
+import numpy as np
+import scipy.signal as sig
+
+from sigutils import *
+
+def mk_sweep(rate, fstep, nsamps, snr):
+    # Noise on both rows; the transmit row also carries each step's tone.
+    steps = int(np.floor(rate/fstep/2))
+    rng = np.random.default_rng(0)
+    shape = (2, (steps-1)*nsamps)
+    ds = 0.01 * (rng.standard_normal(shape) + 1j*rng.standard_normal(shape))
+    t = np.arange(nsamps) / rate
+    ampl = 0.01 * np.sqrt(2) * 10**(snr/20)
+    for i in range(1, steps):
+        ds[1, (i-1)*nsamps:i*nsamps] += ampl * np.exp(2j*np.pi*i*fstep*t)
+    return ds.astype(np.complex64), steps
+
+def loop_powers(ds, steps, nsamps, fstep, filtbw, rate):
+    # The old analyze-data.py loop: redesign and filter per step and row.
+    nyq = 0.5*rate
+    foff = filtbw/2
+    pwrs = []
+    for i in range(1, steps):
+        b, a = sig.butter(5, [(i*fstep - foff)/nyq, (i*fstep + foff)/nyq],
+                          btype='band')
+        for row in ds:
+            fsamps = sig.lfilter(b, a, row[(i-1)*nsamps:i*nsamps])
+            pwrs.append(10.0 * np.log10(np.sum(np.square(np.abs(fsamps))) /
+                                        len(fsamps)))
+    return np.array(pwrs).reshape(steps-1, 2).T.ravel()
+
+def bank_powers(ds, steps, nsamps, fstep, filtbw, rate):
+    segs = ds.reshape(2*(steps-1), nsamps)
+    bands = [(i*fstep - filtbw/2, i*fstep + filtbw/2)
+             for i in range(1, steps)] * 2
+    return get_avg_power(filter_bank(segs, bands, rate), axis=-1)
+
+def fft_powers(ds, steps, nsamps, fstep, filtbw, rate):
+    segs = ds.reshape(2*(steps-1), nsamps)
+    tones = [i*fstep for i in range(1, steps)] * 2
+    return tone_powers(segs, tones, filtbw, rate)
+
+def bench(name, func, ref, reps, *args):
+    stime = time.time()
+    for i in range(reps):
+        pwrs = func(*args)
+    elapsed = (time.time() - stime) / reps
+    print("%-6s %9.2f ms/sweep  max |diff| vs loop: %.3f dB" %
+          (name, elapsed*1e3, np.max(np.abs(pwrs - ref))))
+    return elapsed
+
+def parse_args():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nsamps", type=int, nargs="+", default=[1024, 10000])
+    parser.add_argument("--rate", type=float, default=1e6)
+    parser.add_argument("--fstep", type=float, default=1e4)
+    parser.add_argument("--filtbw", type=float, default=1e4)
+    parser.add_argument("--snr", type=float, default=20, help="Tone SNR within the filter band (dB)")
+    parser.add_argument("-r", "--reps", type=int, default=5)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    for nsamps in args.nsamps:
+        (ds, steps) = mk_sweep(args.rate, args.fstep, nsamps, args.snr)
+        fargs = (ds, steps, nsamps, args.fstep, args.filtbw, args.rate)
+        print("%d steps x %d samples:" % (steps-1, nsamps))
+        ref = loop_powers(*fargs)
+        tloop = bench("loop", loop_powers, ref, args.reps, *fargs)
+        tbank = bench("bank", bank_powers, ref, args.reps, *fargs)
+        tfft = bench("fft", fft_powers, ref, args.reps, *fargs)
+        print("speedup: bank %.1fx, fft %.1fx" % (tloop/tbank, tloop/tfft))
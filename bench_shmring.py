@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+#
+# Throughput of RESULT messages crossing the worker/connector process
+# boundary: whole serialized SessionMsg over mp.Pipe versus samples parked
+# in a ShmRing with only a small descriptor on the pipe.
+#
+
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+
+import measurements_pb2 as measpb
+from rpccalls import *
+from shmring import ShmRing, stash_samples, release_samples, DEF_RING_SIZE
+
+def producer(pipe, ring, nsamps, reps):
+    samples = np.zeros(nsamps, dtype=np.complex64)
+    for i in range(reps):
+        rmsg = measpb.SessionMsg()
+        rmsg.type = measpb.SessionMsg.RESULT
+        add_samples(rmsg, samples)
+        stash_samples(ring, rmsg)
+        pipe.send(rmsg.SerializeToString())
+        # Wait for the consumer so each transfer is timed on its own.
+        pipe.recv()
+
+def bench(mode, nsamps, reps, shmsize):
+    # Same ring the client and controller use, so results that don't fit
+    # fall back to the pipe here just as they would there.
+    ring = ShmRing(shmsize) if mode == 'shm' else None
+    (c1, c2) = mp.Pipe()
+    proc = mp.Process(target=producer, args=(c2, ring, nsamps, reps))
+    proc.start()
+    elapsed = 0
+    piped = 0
+    for i in range(reps):
+        stime = time.time()
+        rmsg = measpb.SessionMsg()
+        rmsg.ParseFromString(c1.recv())
+        if ring and not rmsg.HasField("shm"):
+            piped += 1
+        # Read in place and free the space once done, as meascon does.
+        samps = get_samples(rmsg, ring)
+        assert samps.size == nsamps
+        samps.sum()
+        del samps
+        if ring:
+            release_samples(ring, rmsg)
+        elapsed += time.time() - stime
+        c1.send(True)
+    proc.join()
+    if ring:
+        ring.unlink()
+    nbytes = nsamps * 8
+    print("%-4s %9d samples: %8.1f ms/result, %7.1f MB/s%s" %
+          (mode, nsamps, elapsed/reps*1e3, nbytes*reps/elapsed/1e6,
+           " (%d/%d over the pipe)" % (piped, reps) if piped else ""))
+
+def parse_args():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nsamps", type=int, nargs="+", default=[1000000, 10000000, 50000000])
+    parser.add_argument("-r", "--reps", type=int, default=5)
+    parser.add_argument("--shmsize", type=int, default=DEF_RING_SIZE >> 20, help="Shared memory ring size in MB")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    for nsamps in args.nsamps:
+        for mode in ('pipe', 'shm'):
+            bench(mode, nsamps, args.reps, args.shmsize << 20)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+#
+# Reusable sample buffers
+#
+
+import threading
+import collections
+import numpy as np
+
+class BufferPool:
+    """Free list of sample arrays, keyed by shape.
+
+    Arrays handed back with `put()` are reused by the next `get()` of the
+    same shape, so repeated captures (e.g. the steps of a sequence) don't
+    allocate fresh multi-megabyte buffers each time.
+    """
+    MAX_FREE = 2  # Per shape
+
+    def __init__(self, dtype = np.complex64):
+        self.dtype = dtype
+        self.free = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    def get(self, shape):
+        with self.lock:
+            if self.free[shape]:
+                return self.free[shape].pop()
+        return np.empty(shape, dtype=self.dtype)
+
+    def put(self, arr):
+        with self.lock:
+            if len(self.free[arr.shape]) < self.MAX_FREE:
+                self.free[arr.shape].append(arr)
@@ -9,23 +9,35 @@ import random
 import multiprocessing as mp
 
 import measurements_pb2 as measpb
+from framing import FrameReader, pack_frame
+from shmring import unstash_samples
+from spool import ResultSpool
 
 DEF_IP = "127.0.0.1"
 DEF_PORT = 5555
+DEF_SPOOLDIR = "/var/tmp"
 
 
 class ClientConnector:
-    MAX_CONN_TRIES = 12 * 15  # Each try waits CONN_SLEEP seconds before next.
-    CONN_SLEEP = 5
-    
-    def __init__(self, srvaddr, srvport):
+    MAX_CONN_TRIES = 12 * 15  # Consecutive failed tries before giving up.
+    CONN_SLEEP = 1            # First retry delay; doubles on each failure,
+    CONN_SLEEP_MAX = 60       # up to this, with random jitter.
+    CONN_TIMEOUT = 10
+
+    def __init__(self, srvaddr, srvport, spooldir = DEF_SPOOLDIR, name = None):
         self.srvip = socket.gethostbyname(srvaddr)
         self.srvport = srvport
-        self.name = socket.gethostname().split('.',1)[0]
+        self.name = name or socket.gethostname().split('.',1)[0]
+        self.spooldir = spooldir
+        self.spool = None
         self.logger = None
         self.pipe = None
         self.sock = None
+        self.reader = None
+        self.ring = None
         self.sid = 0
+        self.tries = 0
+        self.next_try = 0
         self.sel = selectors.DefaultSelector()
 
     def __del__(self):
@@ -38,16 +50,6 @@ class ClientConnector:
             except:
                 pass
 
-    def _get_msg_from_sock(self, conn):
-        smsg = None
-        ldata = conn.recv(4)
-        if ldata:
-            mlen = struct.unpack(">L", ldata)[0]
-            mbuf = conn.recv(mlen)
-            smsg = measpb.SessionMsg()
-            smsg.ParseFromString(mbuf)
-        return smsg
-
     def _send_msg(self, conn, msg):
         smsg = msg.SerializeToString()
         if isinstance(conn, mp.connection.Connection):
@@ -56,54 +58,76 @@ class ClientConnector:
             packed_len = struct.pack(">L", len(smsg))
             conn.sendall(packed_len + smsg)
 
+    def _send_frame(self, frame):
+        # Results are spooled, so a failed send just drops the connection.
+        if not self.sock:
+            return
+        try:
+            self.sock.sendall(frame)
+        except OSError as e:
+            self.logger.warning("Send to %s:%s failed: %s" %
+                                (self.srvip, self.srvport, e))
+            self._disconnect()
+
+    def _backoff(self):
+        self.tries += 1
+        if self.tries > self.MAX_CONN_TRIES:
+            self.logger.error("Too many connection attempts! Exiting.")
+            raise Exception("Too many connection attempts! Exiting.")
+        delay = min(self.CONN_SLEEP_MAX,
+                    self.CONN_SLEEP * 2**min(self.tries - 1, 16))
+        return random.uniform(delay/2, delay)
+
     def _connect(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.CONN_TIMEOUT)
+        try:
+            sock.connect((self.srvip, self.srvport))
+        except OSError as e:
+            sock.close()
+            delay = self._backoff()
+            self.logger.warning("Failed to connect to %s:%s: %s (retry in %.1fs)"
+                                % (self.srvip, self.srvport, e, delay))
+            self.next_try = time.time() + delay
+            return False
+        sock.settimeout(None)
+        self.sock = sock
+        self.reader = FrameReader()
         self.sel.register(self.sock, selectors.EVENT_READ, self._readsock)
-        tries = 0
-        while True:
-            try:
-                self.sock.connect((self.srvip, self.srvport))
-                break
-            except (ConnectionRefusedError,) as e:
-                self.logger.warning("Failed to connect to %s:%s: %s" %
-                                    (self.srvip, self.srvport, e))
-                tries += 1
-                if tries > self.MAX_CONN_TRIES:
-                    self.logger.error("Too many connection attempts! Exiting.")
-                    raise Exception("Too many connection attempts! Exiting.")
-                time.sleep(self.CONN_SLEEP)
+        self.tries = 0
+        return True
+
+    def _disconnect(self):
+        self.sel.unregister(self.sock)
+        self.sock.close()
+        self.sock = None
+        self.next_try = time.time() + self._backoff()
 
     def _readsock(self, conn, mask):
-        msg = self._get_msg_from_sock(conn)
-        if msg:
-            self.DISPATCH[msg.type](self, msg, conn)
+        if self.reader.recv_from(conn):
+            for msg in self.reader.get_messages():
+                self.DISPATCH[msg.type](self, msg, conn)
         else:
             self.logger.warning("Connection to %s:%s closed unexpectedly." %
-                                conn.getpeername())
-            self.sel.unregister(conn)
-            self.send_init()
+                                (self.srvip, self.srvport))
+            self._disconnect()
 
     def _readpipe(self, pipe, mask):
             msg = measpb.SessionMsg()
             msg.ParseFromString(pipe.recv())
             self.DISPATCH[msg.type](self, msg, pipe)
 
-    def _get_attr(self, msg, key):
-        for kv in msg.attributes:
-            if kv.key == key: return kv.val
-        return None
-
-    def _add_attr(self, msg, key, val):
-        attr = msg.attributes.add()
-        attr.key = key
-        attr.val = val
-
     def handle_init(self, msg, conn):
         self.sid = msg.sid
         self.logger.info("Connected with session id: %d" % self.sid)
+        # Resend anything the server never acknowledged.
+        if len(self.spool):
+            self.logger.info("Replaying %d spooled results." % len(self.spool))
+            for frame in self.spool.frames():
+                self._send_frame(frame)
 
     def handle_call(self, msg, conn):
-        func = self._get_attr(msg, "funcname")
+        func = msg.funcname
         if func in self.CALLS:
             # Handle calls meant for the connector (this class).
             self._send_msg(conn, self.CALLS[func](self, msg))
@@ -113,9 +137,13 @@ class ClientConnector:
 
     def handle_result(self, msg, conn):
         # Pass result back to server.
+        unstash_samples(self.ring, msg)
         msg.sid = self.sid
-        self._add_attr(msg, "clientname", self.name)
-        self._send_msg(self.sock, msg)
+        msg.clientname = self.name
+        self._send_frame(self.spool.add(msg))
+
+    def handle_ack(self, msg, conn):
+        self.spool.ack(msg)
 
     def handle_hb(self, msg, conn):
         pass
@@ -123,25 +151,37 @@ class ClientConnector:
     def handle_close(self, msg, conn):
         pass
     
-    def send_init(self):
-        self._connect()
+    def _mk_init(self):
         msg = measpb.SessionMsg()
         msg.type = measpb.SessionMsg.INIT
         msg.sid = self.sid
-        self._add_attr(msg, "clientname", self.name)
-        self._send_msg(self.sock, msg)
+        msg.clientname = self.name
+        return msg
+
+    def send_init(self):
+        if self._connect():
+            self._send_frame(pack_frame(self._mk_init()))
+
+    def _open_spool(self):
+        self.spool = ResultSpool("%s/mcli-%s.spool" % (self.spooldir, self.name))
 
     def run(self, pipe, logger):
         self.pipe = pipe
         self.sel.register(self.pipe, selectors.EVENT_READ, self._readpipe)
         self.logger = logger
+        self._open_spool()
         self.send_init()
 
         while True:
-            events = self.sel.select()
+            timeout = None
+            if not self.sock:
+                timeout = max(0, self.next_try - time.time())
+            events = self.sel.select(timeout)
             for key, mask in events:
                 callback = key.data
                 callback(key.fileobj, mask)
+            if not self.sock and time.time() >= self.next_try:
+                self.send_init()
 
     CALLS = {}
                 
@@ -151,4 +191,5 @@ class ClientConnector:
         measpb.SessionMsg.RESULT: handle_result,
         measpb.SessionMsg.HB: handle_hb,
         measpb.SessionMsg.CLOSE: handle_close,
+        measpb.SessionMsg.ACK: handle_ack,
     }
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+#
+# Length-prefixed SessionMsg framing for connector sockets
+#
+
+import struct
+
+import measurements_pb2 as measpb
+
+HDR_FMT = ">L"
+HDR_LEN = struct.calcsize(HDR_FMT)
+
+def pack_frame(msg):
+    smsg = msg.SerializeToString()
+    return struct.pack(HDR_FMT, len(smsg)) + smsg
+
+class FrameReader:
+    """Incremental reader for length-prefixed messages on one connection.
+
+    Data is pulled in with `recv_from()` whenever the socket is readable
+    (or pushed in with `feed()`, e.g. from an asyncio protocol);
+    `get_messages()` then returns every message that has fully arrived,
+    leaving any partial header or body buffered for the next read.
+    """
+    RECV_SIZE = 256 * 1024
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def recv_from(self, conn):
+        # Returns False if the connection is closed (or broken).
+        try:
+            data = conn.recv(self.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except ConnectionError:
+            return False
+        if not data:
+            return False
+        self.feed(data)
+        return True
+
+    def feed(self, data):
+        self.buf += data
+
+    def get_messages(self):
+        msgs = []
+        pos = 0
+        blen = len(self.buf)
+        with memoryview(self.buf) as mv:
+            while blen - pos >= HDR_LEN:
+                mlen = struct.unpack_from(HDR_FMT, mv, pos)[0]
+                end = pos + HDR_LEN + mlen
+                if end > blen:
+                    break
+                msg = measpb.SessionMsg()
+                msg.ParseFromString(mv[pos + HDR_LEN:end])
+                msgs.append(msg)
+                pos = end
+        if pos:
+            del self.buf[:pos]
+        return msgs
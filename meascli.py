@@ -5,6 +5,8 @@
 
 import logging
 import time
+import queue
+import threading
 import multiprocessing as mp
 import numpy as np
 import scipy.signal as sig
@@ -14,8 +16,14 @@ import argparse
 from rpccalls import *
 from sigutils import *
 import measurements_pb2 as measpb
-from clientconnector import ClientConnector
-from radio import Radio
+from clientconnector import ClientConnector, DEF_SPOOLDIR
+from aioconnector import AsyncClientConnector
+from simradio import SimRadio, DirAir
+try:
+    from radio import Radio
+except ImportError:
+    Radio = None  # No UHD bindings; only --sim will work.
+from shmring import ShmRing, stash_samples, DEF_RING_SIZE
 
 LOGFILE="/var/tmp/ccontroller.log"
 DEF_IP = "127.0.0.1"
@@ -23,16 +31,53 @@ DEF_PORT = 5555
 DEF_LOGLEVEL = logging.DEBUG
 
 class MeasurementsClient:
-    XMIT_SAMPS_MIN = 500000
+    XMIT_SAMPS_MAX = 500000
+    MEAS_CHUNK = 1 << 18  # Longer power captures are measured as they stream.
     TOFF = 0.5
+    HW_TOFF = 0.05  # Guard interval when the radio times steps itself.
+    STEP_LEAD = 0.1  # How early to hand the radio a timed step.
+    PIPE_DEPTH = 4  # Steps that may wait for processing (and results to send).
     
-    def __init__(self, servaddr, servport, device_args = "", rx_txrx = False):
+    def __init__(self, servaddr, servport, device_args = "", rx_txrx = False,
+                 aionet = False, spooldir = DEF_SPOOLDIR, rxstream = False,
+                 hwtime = False, name = None, simair = None,
+                 shmsize = DEF_RING_SIZE):
         self.pipe = None
+        self.ring = None
+        self.shmsize = shmsize
         self.conproc = None
         self.logger = None
         self.setup_logger()
-        self.radio = Radio(self.logger, device_args, rx_txrx)
-        self.connector = ClientConnector(servaddr, servport)
+        if aionet:
+            self.connector = AsyncClientConnector(servaddr, servport, spooldir,
+                                                  name)
+        else:
+            self.connector = ClientConnector(servaddr, servport, spooldir, name)
+        if simair:
+            self.radio = SimRadio(self.logger, self.connector.name,
+                                  DirAir(simair))
+        else:
+            self.radio = Radio(self.logger, device_args, rx_txrx,
+                               rxstream=rxstream)
+        if hwtime:
+            self.radio.sync_time()
+        self.rxchans = list(self.radio.rxchans)
+        # Calls run as a pipeline: the main thread drives the radio, and
+        # hands each capture to a processing thread, which hands finished
+        # results to a sending thread.  Bounded, so a slow stage holds up
+        # the radio instead of piling up samples.
+        self.procq = queue.Queue(self.PIPE_DEPTH)
+        self.sendq = queue.Queue(self.PIPE_DEPTH)
+        self.sendlock = threading.Lock()
+        # Radio calls wait their turn in `callq` and run one at a time on
+        # the call thread, so the main thread stays free to serve
+        # CONTROL_CALLS (e.g. cancel) right away.
+        self.callq = queue.Queue()
+        self.calllock = threading.Lock()
+        self.queued = set()
+        self.cancelled = set()
+        self.current = None
+        self.cancelevt = threading.Event()
 
     def setup_logger(self):
         fmat = logging.Formatter(fmt='%(asctime)s:%(levelname)s: %(message)s',
@@ -49,95 +94,328 @@ class MeasurementsClient:
     def echo_reply(self, args, rmsg):
         self.logger.info("Received Echo Request. Sending response.")
         add_attr(rmsg, "type", "reply")
-        self.pipe.send(rmsg.SerializeToString())
+
+    def cancel_calls(self, args, rmsg):
+        # Queued calls are dropped when their turn comes; the running one
+        # stops at its next step or chunk, or its TX stream is cut short.
+        with self.calllock:
+            queued = [uuid for uuid in self.queued
+                      if args['uuid'] in (0, uuid)]
+            self.cancelled.update(queued)
+            running = self.current if args['uuid'] in (0, self.current) \
+                else None
+            if running:
+                self.cancelevt.set()
+        if running:
+            self.radio.cancel()
+        uuids = sorted(queued + ([running] if running else []))
+        self.logger.info("Cancelling calls: %s" % uuids)
+        add_attr(rmsg, "cancelled", ",".join(str(uuid) for uuid in uuids))
+
+    def _set_channels(self, args, rmsg):
+        # Captures return one row per channel; results hold the rows (or
+        # the per-channel measurements of each step) in `channels` order.
+        if args.get('channels'):
+            chans = [int(c) for c in args['channels'].split(',')]
+            add_attr(rmsg, "channels", args['channels'])
+        else:
+            chans = self.rxchans
+        self.radio.set_rx_channels(chans)
+
+    def _set_reduce(self, args, rmsg):
+        # With `reduce`, get_samples returns a per-step summary of the
+        # capture (see REDUCERS) in place of its raw IQ.
+        if args['get_samples'] and args['reduce']:
+            if args['reduce'] not in self.REDUCERS:
+                self.logger.error("Unknown reduce mode: %s" % args['reduce'])
+                args['reduce'] = ''
+                return
+            add_attr(rmsg, "reduce", args['reduce'])
+            add_attr(rmsg, "nbands", band_count(args['rate'],
+                                                args['filter_bw']))
 
     def recv_samps(self, args, rmsg):
         add_attr(rmsg, "rate", args['rate'])
         self.logger.info("Collecting %d samples." % args['nsamps'])
+        self._set_channels(args, rmsg)
         self.radio.tune(args['freq'], args['gain'], args['rate'])
-        self._do_recv_samps(args, rmsg)
+        return self._do_recv_samps(args, rmsg)
 
     def xmit_sine(self, args, rmsg):
         self.logger.info("Sending sine wave with freq %f" % args['wfreq'])
         self.radio.tune(args['freq'], args['gain'], args['rate'])
         args['end_time'] = time.time() + args['duration']
-        self._do_xmit(args, rmsg)
         add_attr(rmsg, "result", "done")
+        return self._do_xmit(args, rmsg)
 
     def meas_power(self, args, rmsg):
+        self._set_channels(args, rmsg)
+        self._set_reduce(args, rmsg)
         self.radio.tune(args['freq'], args['gain'], args['rate'])
-        self._do_meas_power(args, rmsg)
+        return self._do_meas_power(args, rmsg)
 
+    # The _do_* functions do a call's (or sequence step's) radio work and
+    # return what is left to do as (method, data); the processing thread
+    # runs method(args, rmsg, data).  Only that thread touches `rmsg` once
+    # the call is under way.
     def _do_recv_samps(self, args, rmsg):
-        samples = self.radio.recv_samples(args['nsamps'])
-        for samp in samples[0]:
-            msamp = rmsg.samples.add()
-            msamp.r, msamp.j = samp.real, samp.imag
+        samples = self.radio.recv_samples(args['nsamps'],
+                                          start_time=args.get('step_time'))
+        return (self._add_recv_samps, samples)
+
+    def _add_recv_samps(self, args, rmsg, samples):
+        add_samples(rmsg, samples)
+        self.radio.release(samples)
+
+    def _add_measurements(self, args, rmsg, vals):
+        rmsg.measurements.extend(vals)
 
     def _do_meas_power(self, args, rmsg):
         foff = args['filter_bw']/2
         flo, fhi = args['wfreq']-foff, args['wfreq']+foff
         #self.logger.info("Sampling power between %f and %f" %
         #                 (args['freq'] + flo, args['freq'] + fhi))
-        samps = self.radio.recv_samples(args['nsamps'])
-        fsamps = butter_filt(samps[0], flo, fhi, args['rate'])
-        rmsg.measurements.append(get_avg_power(fsamps))
-        if args['get_samples']:
-            for samp in samps[0]:
-                msamp = rmsg.samples.add()
-                msamp.r, msamp.j = samp.real, samp.imag
+        if args['nsamps'] > self.MEAS_CHUNK and not args['get_samples'] \
+           and args['power_method'] != 'fft':
+            meter = PowerMeter(flo, fhi, args['rate'],
+                               nchans=len(self.radio.rxchans))
+            chunks = self.radio.recv_chunks(args['nsamps'], self.MEAS_CHUNK,
+                                            start_time=args.get('step_time'))
+            for chunk in chunks:
+                meter.feed(chunk)
+                if self.cancelevt.is_set():
+                    chunks.close()
+                    break
+            return (self._add_measurements, meter.power())
+        samps = self.radio.recv_samples(args['nsamps'],
+                                        start_time=args.get('step_time'))
+        return (self._proc_meas_power, samps)
+
+    def _proc_meas_power(self, args, rmsg, samps):
+        foff = args['filter_bw']/2
+        flo, fhi = args['wfreq']-foff, args['wfreq']+foff
+        if args['power_method'] == 'fft':
+            rmsg.measurements.extend(tone_powers(samps, args['wfreq'],
+                                                 args['filter_bw'],
+                                                 args['rate']))
+        else:
+            for chsamps in samps:
+                fsamps = butter_filt(chsamps, flo, fhi, args['rate'])
+                rmsg.measurements.append(get_avg_power(fsamps))
+        if args['get_samples'] and args['reduce']:
+            add_samples(rmsg, self.REDUCERS[args['reduce']](self, samps, args))
+        elif args['get_samples']:
+            add_samples(rmsg, samps)
+        self.radio.release(samps)
+
+    # Summaries of a capture, one row per channel, in sub-bands of about
+    # filter_bw (see sigutils.channelize()).
+    def _reduce_bands(self, samps, args):
+        # Power (dB) of every sub-band.
+        nbands = band_count(args['rate'], args['filter_bw'])
+        return get_avg_power(channelize(samps, nbands),
+                             axis=-1).astype(np.float32)
+
+    def _reduce_psd(self, samps, args):
+        # Welch PSD (dB/Hz), one bin per sub-band.
+        nbands = band_count(args['rate'], args['filter_bw'])
+        return welch_psd(samps, nbands, args['rate']).astype(np.float32)
+
+    def _reduce_iq(self, samps, args):
+        # IQ of the sub-band holding the tone, decimated by nbands.
+        nbands = band_count(args['rate'], args['filter_bw'])
+        band = band_index(args['wfreq'], nbands, args['rate'])
+        return channelize(samps, nbands)[:, band].astype(np.complex64)
 
     def _do_xmit(self, args, rmsg):
-        ratio = args['rate']/args['wfreq']
-        nsamps = ratio * np.ceil(self.XMIT_SAMPS_MIN/ratio)
-        sinebuf = mk_sine(int(nsamps), args['wampl'], args['wfreq'],
-                          args['rate'])
-        while time.time() < args['end_time']:
-            self.radio.send_samples(sinebuf)
+        # One exact period (whole number of cycles) of the tone is enough;
+        # the TX stream repeats it seamlessly.  Sequences revisit the same
+        # tones, so the waveforms come from a cache.
+        nsamps = periodic_len(args['wfreq'], args['rate'],
+                              self.XMIT_SAMPS_MAX)
+        sinebuf = get_sine(nsamps, args['wampl'], args['wfreq'],
+                           args['rate'])
+        self.radio.start_txstream(sinebuf, args['end_time'],
+                                  args.get('step_time'))
+        if self.cancelevt.is_set():
+            # Cancelled while the stream was starting up.
+            self.radio.cancel()
+        return (self._add_counts, self.radio.wait_txstream())
+
+    def _add_counts(self, args, rmsg, counts):
+        # Add to any count already in the result.
+        for key, count in counts.items():
+            for kv in rmsg.attributes:
+                if kv.key == key:
+                    kv.val = str(int(kv.val) + count)
+                    break
+            else:
+                add_attr(rmsg, key, count)
+
+    def _step_msg(self, rmsg, step):
+        # Partial result for one step of the call answered by `rmsg`.
+        smsg = measpb.SessionMsg()
+        smsg.type = measpb.SessionMsg.RESULT
+        smsg.uuid = rmsg.uuid
+        smsg.funcname = rmsg.funcname
+        smsg.step = step
+        smsg.partial = True
+        return smsg
 
     def _do_seq(self, args, rmsg, func):
+        # Each step goes out as its own partial result once processed;
+        # `rmsg`, sent last, only marks the end of the sequence.
         self.logger.info("Performing radio command sequence...")
+        if 'channels' in args:
+            self._set_channels(args, rmsg)
+        if 'reduce' in args:
+            self._set_reduce(args, rmsg)
         self.radio.tune(args['freq'], args['gain'], args['rate'])
         steps = int(np.floor(args['rate']/args['freq_step']/2))
         if not args['start_time']:
             args['start_time'] = np.ceil(time.time())
+        # With a synced device clock the radio starts each step on time by
+        # itself; we only need to hand it the step a little early.
+        timed = self.radio.timesynced
+        toff = self.HW_TOFF if timed else self.TOFF
+        add_attr(rmsg, "steps", steps-1)
         for i in range(1,steps):
             args['wfreq'] = i*args['freq_step']
+            args['step_time'] = args['start_time'] + (i-1)*args['time_step']
             args['end_time'] = args['start_time'] + i*args['time_step'] - \
-                self.TOFF
-            sltime = args['start_time'] + (i-1)*args['time_step'] - time.time()
+                toff
+            sltime = args['step_time'] - time.time()
+            if timed:
+                sltime -= self.STEP_LEAD
             if sltime > 0:
-                time.sleep(sltime)
+                self.cancelevt.wait(sltime)
             else:
                 self.logger.info("Late: %f" % sltime)
-            func(self, args, rmsg)
+            if self.cancelevt.is_set():
+                self.logger.info("Sequence cancelled before step %d." % i)
+                break
+            smsg = self._step_msg(rmsg, i)
+            self._queue_work(func(self, args, smsg), args, smsg)
+            self._queue_send(smsg)
+
+    def _queue_send(self, rmsg):
+        # Send `rmsg` once the work queued for it so far is done.
+        self.procq.put((None, None, rmsg, None))
+
+    def _queue_work(self, work, args, rmsg):
+        # Sequence steps reuse `args`; the processing thread gets a copy.
+        if work:
+            (method, data) = work
+            self.procq.put((method, dict(args), rmsg, data))
+
+    def _set_result(self, args, rmsg, result):
+        set_attr(rmsg, "result", result)
+
+    def _mk_result(self, msg):
+        rmsg = measpb.SessionMsg()
+        rmsg.type = measpb.SessionMsg.RESULT
+        rmsg.uuid = msg.uuid
+        rmsg.funcname = msg.funcname
+        return rmsg
+
+    def _call_loop(self):
+        while True:
+            msg = self.callq.get()
+            rmsg = self._mk_result(msg)
+            with self.calllock:
+                self.queued.discard(msg.uuid)
+                skip = msg.uuid in self.cancelled
+                self.cancelled.discard(msg.uuid)
+                if not skip:
+                    self.current = msg.uuid
+                    self.cancelevt.clear()
+            if skip:
+                self.logger.info("Skipping cancelled %s call." % msg.funcname)
+                set_attr(rmsg, "result", "cancelled")
+                self._queue_send(rmsg)
+                continue
+            func = msg.funcname
+            args = {}
+            result = None
+            try:
+                args = RPCCALLS[func].decode(msg)
+                if func.startswith('seq'):
+                    self._do_seq(args, rmsg, self.CALLS[func])
+                else:
+                    self._queue_work(self.CALLS[func](self, args, rmsg),
+                                     args, rmsg)
+            except Exception:
+                self.logger.exception("Call %s failed." % func)
+                result = "error"
+            with self.calllock:
+                self.current = None
+            if not result and self.cancelevt.is_set():
+                result = "cancelled"
+            if result:
+                self._queue_work((self._set_result, result), args, rmsg)
+            self._queue_send(rmsg)
+
+    def _proc_loop(self):
+        # A work item without a method marks the end of its call.
+        while True:
+            (method, args, rmsg, data) = self.procq.get()
+            if method is None:
+                self.sendq.put(rmsg)
+                continue
+            try:
+                method(args, rmsg, data)
+            except Exception:
+                self.logger.exception("Processing for %s failed." %
+                                      rmsg.funcname)
+
+    def _send_loop(self):
+        while True:
+            self._send_result(self.sendq.get())
+
+    def _send_result(self, rmsg):
+        # Bulk samples go through shared memory; only the rest is piped.
+        with self.sendlock:
+            stash_samples(self.ring, rmsg, logger=self.logger)
+            self.pipe.send(rmsg.SerializeToString())
 
     def run(self):
         (c1, c2) = mp.Pipe()
         self.pipe = c1
+        self.ring = self.connector.ring = ShmRing(self.shmsize)
         self.netproc = mp.Process(target=self.connector.run,
                                   args=(c2, self.logger))
         self.netproc.start()
+        for loop in (self._call_loop, self._proc_loop, self._send_loop):
+            threading.Thread(target=loop, daemon=True).start()
+
+        try:
+            self._dispatch_calls()
+        finally:
+            self.ring.unlink()
 
+    def _dispatch_calls(self):
         while True:
             msg = measpb.SessionMsg()
             msg.ParseFromString(self.pipe.recv())
-            func = get_attr(msg, "funcname")
-            if func in self.CALLS:
-                args = RPCCALLS[func].decode(msg)
-                rmsg = measpb.SessionMsg()
-                rmsg.type = measpb.SessionMsg.RESULT
-                add_attr(rmsg, "funcname", func)
-                if func.startswith('seq'):
-                    self._do_seq(args, rmsg, self.CALLS[func])
-                else:
-                    self.CALLS[func](self, args, rmsg)
-                self.pipe.send(rmsg.SerializeToString())
+            func = msg.funcname
+            if func in self.CONTROL_CALLS:
+                rmsg = self._mk_result(msg)
+                self.CONTROL_CALLS[func](self, RPCCALLS[func].decode(msg),
+                                         rmsg)
+                self._send_result(rmsg)
+            elif func in self.CALLS:
+                with self.calllock:
+                    self.queued.add(msg.uuid)
+                self.callq.put(msg)
             else:
                 self.logger.error("Unknown function called: %s" % func)
 
-    CALLS = {
+    CONTROL_CALLS = {
         "echo": echo_reply,
+        "cancel": cancel_calls,
+    }
+
+    CALLS = {
         "rxsamples": recv_samps,
         "txsine": xmit_sine,
         "measure_power": meas_power,
@@ -146,6 +424,12 @@ class MeasurementsClient:
         "seq_transmit": _do_xmit,
     }
 
+    REDUCERS = {
+        "bands": _reduce_bands,
+        "psd": _reduce_psd,
+        "iq": _reduce_iq,
+    }
+
 
 def parse_args():
     """Parse the command line arguments"""
@@ -155,6 +439,13 @@ def parse_args():
     parser.add_argument("-s", "--host", help="Orchestrator host to connect to", default=DEF_IP, type=str)
     parser.add_argument("-p", "--port", help="Orchestrator port", default=DEF_PORT, type=int)
     parser.add_argument("-d", "--daemon", help="Run as daemon", action="store_true")
+    parser.add_argument("--aionet", help="Use the asyncio connector engine", action="store_true")
+    parser.add_argument("--spooldir", help="Where to spool unacknowledged results", default=DEF_SPOOLDIR, type=str)
+    parser.add_argument("--rxstream", help="Keep the receiver streaming into a ring buffer", action="store_true")
+    parser.add_argument("--name", help="Client name (default: short hostname)", default=None, type=str)
+    parser.add_argument("--sim", help="Use a simulated radio sharing the air through this directory", default=None, type=str, metavar="AIRDIR")
+    parser.add_argument("--hwtime", help="Sync radio time to host time and time sequence steps in hardware", action="store_true")
+    parser.add_argument("--shmsize", help="Shared memory ring size in MB; bigger results go over the pipe", default=DEF_RING_SIZE >> 20, type=int)
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -163,5 +454,8 @@ if __name__ == "__main__":
         # Daemonize
         dcxt = daemon.DaemonContext(umask=0o022)
         dcxt.open()
-    meascli = MeasurementsClient(args.host, args.port, args.args, args.usetxrx)
+    meascli = MeasurementsClient(args.host, args.port, args.args, args.usetxrx,
+                                 args.aionet, args.spooldir, args.rxstream,
+                                 args.hwtime, args.name, args.sim,
+                                 args.shmsize << 20)
     meascli.run()
@@ -5,12 +5,15 @@ import time
 import argparse
 import logging
 import json
+import random
 import multiprocessing as mp
 import numpy as np
 import h5py
 
 import measurements_pb2 as measpb
 from serverconnector import ServerConnector
+from aioconnector import AsyncServerConnector
+from shmring import ShmRing, unstash_samples, release_samples, DEF_RING_SIZE
 from rpccalls import *
 from sigutils import *
 
@@ -19,25 +22,85 @@ DEF_DFNAME="measurements.hdf5"
 DEF_LOGFILE="/var/tmp/mcontroller.log"
 LOGLEVEL = logging.DEBUG
 
+def merge_steps(rmsg, steps):
+    """Fold the partial (per-step) results of a sequence call into its
+    final result, as one message per client like calls return."""
+    merged = measpb.SessionMsg()
+    merged.CopyFrom(rmsg)
+    for step in sorted(steps, key=lambda smsg: smsg.step):
+        merged.measurements.extend(step.measurements)
+        if step.sample_count:
+            add_samples(merged, get_samples(step))
+        for kv in step.attributes:
+            # Counts (e.g. tx_underflows) add up over the steps.
+            total = get_attr(merged, kv.key)
+            if total is None:
+                add_attr(merged, kv.key, kv.val)
+            elif total.isdigit() and kv.val.isdigit():
+                set_attr(merged, kv.key, int(total) + int(kv.val))
+    return merged
+
+class PendingCall:
+    """An outstanding RPC call and the results filed under its uuid.
+
+    Partial results go to `on_step` as they arrive if set, and are
+    otherwise merged into their client's final result.
+    """
+    def __init__(self, uuid, funcname, clients):
+        self.uuid = uuid
+        self.funcname = funcname
+        self.clients = list(clients)
+        self.results = {}
+        self.steps = {}
+        self.on_step = None
+
+    def add_result(self, rmsg):
+        if rmsg.partial:
+            if self.on_step:
+                self.on_step(rmsg)
+            else:
+                self.steps.setdefault(rmsg.clientname, []).append(rmsg)
+            return
+        steps = self.steps.pop(rmsg.clientname, None)
+        if steps:
+            rmsg = merge_steps(rmsg, steps)
+        self.results[rmsg.clientname] = rmsg
+
+    def missing(self, clients = None):
+        return [c for c in self.clients
+                if c not in self.results and (clients is None or c in clients)]
+
+    def done(self, clients = None):
+        return not self.missing(clients)
+
 class MeasurementsController:
     POLLTIME = 10
     DEF_TOFF = 2
     TX_TOFF = 0.5
+    HW_TX_TOFF = 0.05  # Clients run with --hwtime
     LOGFMAT = '%(asctime)s:%(levelname)s: %(message)s'
     LOGDATEFMAT = '%Y-%m-%d %H:%M:%S'
 
     def __init__(self, args):
         self.clients = {}
         self.pipe = None
+        self.ring = None
         self.conproc = None
         self.datadir = None
         self.dsfile = None
         self.start_time = 0
         self.last_results = []
+        self.pending = {}
+        self.tagged = {}
+        self.uuid = random.getrandbits(30)
         self.dfname = args.dfname
+        self.shmsize = args.shmsize << 20
         self._setup_logger(args.logfile)
         self._setup_datadir(args.datadir)
-        self.connector = ServerConnector()
+        if args.aionet:
+            self.connector = AsyncServerConnector()
+        else:
+            self.connector = ServerConnector()
 
     def _setup_logger(self, logfile):
         fmat = logging.Formatter(fmt=self.LOGFMAT, datefmt=self.LOGDATEFMAT)
@@ -61,15 +124,25 @@ class MeasurementsController:
     def _clear_start_time(self):
         self.start_time = 0
 
-    def _get_connected_clients(self):
-        # Get list of clients from ServerConnector
+    def _get_connected_clients(self, patterns = []):
+        # Get list of clients from ServerConnector, optionally limited to
+        # those matching the given names/group patterns.
         cmsg = measpb.SessionMsg()
         cmsg.type = measpb.SessionMsg.CALL
-        add_attr(cmsg, "funcname", ServerConnector.CALL_GETCLIENTS)
+        cmsg.funcname = ServerConnector.CALL_GETCLIENTS
+        cmsg.uuid = self._next_uuid()
+        cmsg.clients.extend(patterns)
         self.pipe.send(cmsg.SerializeToString())
+        while True:
+            rmsg = self._recv_msg()
+            if rmsg.uuid == cmsg.uuid:
+                return rmsg.clients
+            self._route_msg(rmsg)
+
+    def _recv_msg(self):
         rmsg = measpb.SessionMsg()
         rmsg.ParseFromString(self.pipe.recv())
-        return rmsg.clients
+        return rmsg
 
     def _get_client_list(self, cmd):
         clients = None
@@ -77,13 +150,84 @@ class MeasurementsController:
             clients = list(cmd['client_list'])
         if not clients or clients[0] == "all":
             clients = self._get_connected_clients()
-        return clients
+        elif any(c in name for name in clients for c in "*?["):
+            clients = self._get_connected_clients(clients)
+        return list(clients)
+
+    def _next_uuid(self):
+        self.uuid = self.uuid % 0x7fffffff + 1
+        return self.uuid
+
+    def _rpc_send(self, cmsg, clients, tag = None):
+        # Send a call tagged with a fresh uuid and return its PendingCall.
+        cmsg.uuid = self._next_uuid()
+        cmsg.ClearField("clients")
+        cmsg.clients.extend(clients)
+        call = PendingCall(cmsg.uuid, cmsg.funcname, clients)
+        self.pending[call.uuid] = call
+        if tag:
+            self.tagged[tag] = call
+        self.pipe.send(cmsg.SerializeToString())
+        return call
 
     def _rpc_call(self, cmd):
-        self.logger.info("Running %s on: %s" % (cmd['cmd'], cmd['client_list']))
+        clients = self._get_client_list(cmd)
+        self.logger.info("Running %s on: %s" % (cmd['cmd'], clients))
         cmsg = RPCCALLS[cmd['cmd']].encode(**cmd)
-        cmsg.clients.extend(cmd['client_list'])
-        self.pipe.send(cmsg.SerializeToString())
+        return self._rpc_send(cmsg, clients, cmd.get('tag'))
+
+    def _route_msg(self, rmsg):
+        call = self.pending.get(rmsg.uuid)
+        if not (call and call.on_step and rmsg.partial):
+            # Only steps stored on arrival read their samples in place.
+            # Anything kept around gets its own copy, as ring space has
+            # to be freed in order.
+            unstash_samples(self.ring, rmsg)
+        if not call:
+            self.logger.warning("Dropping result from %s for unknown call %d" %
+                                (rmsg.clientname, rmsg.uuid))
+            return
+        if rmsg.partial:
+            self.logger.info("Received %s step %d from: %s" %
+                             (call.funcname, rmsg.step, rmsg.clientname))
+        else:
+            self.logger.info("Received %s result from: %s" %
+                             (call.funcname, rmsg.clientname))
+        try:
+            call.add_result(rmsg)
+        finally:
+            release_samples(self.ring, rmsg)
+
+    def _route_results(self, timeout):
+        # File everything that arrives within `timeout` under its call.
+        if self.pipe.poll(timeout):
+            while self.pipe.poll(0):
+                self._route_msg(self._recv_msg())
+
+    def wait_calls(self, calls, timeout, clients = None):
+        """Wait for results of `calls` (optionally only from `clients`)."""
+        waittime = time.time() + timeout
+        while not all(call.done(clients) for call in calls):
+            remaining = waittime - time.time()
+            if remaining <= 0:
+                for call in calls:
+                    if not call.done(clients):
+                        self.logger.warning("Timed out waiting for %s from: %s" %
+                                            (call.funcname, call.missing(clients)))
+                break
+            self._route_results(min(remaining, self.POLLTIME))
+        # Tags are kept until their call has all its results, so they can
+        # still be waited on again or cancelled after a timeout.
+        for (tag, call) in list(self.tagged.items()):
+            if call.done():
+                del self.tagged[tag]
+        # Calls that were only waited on for some of their clients stay
+        # outstanding for the rest, as do unfinished tagged calls.
+        tagged = list(self.tagged.values())
+        for call in calls:
+            if call.done() or \
+               (not call.done(clients) and call not in tagged):
+                self.pending.pop(call.uuid, None)
 
     def _get_datafile(self):
         if not self.dsfile:
@@ -96,30 +240,30 @@ class MeasurementsController:
         time.sleep(cmd['duration'])
         
     def cmd_waitres(self, cmd):
+        # Wait on one tagged call, or on everything still outstanding.
+        if 'tag' in cmd:
+            call = self.tagged.get(cmd['tag'])
+            if not call:
+                self.logger.warning("No outstanding call tagged '%s'." %
+                                    cmd['tag'])
+                return
+            calls = [call]
+        else:
+            calls = list(self.pending.values())
         clients = self._get_client_list(cmd)
-        waittime = time.time() + cmd['timeout']
-        self.last_results = []
         self.logger.info("Waiting for clients: %s" % clients)
-        while time.time() < waittime and len(clients):
-            if self.pipe.poll(self.POLLTIME):
-                rmsg = measpb.SessionMsg()
-                rmsg.ParseFromString(self.pipe.recv())
-                clientname = get_attr(rmsg, "clientname")
-                self.logger.info("Received result from: %s", clientname)
-                for i in range(len(clients)):
-                    if clients[i] == clientname:
-                        self.last_results.append(rmsg)
-                        del clients[i]
-                        break
+        self.wait_calls(calls, cmd['timeout'], clients)
+        self.last_results = [res for call in calls
+                             for res in call.results.values()
+                             if res.clientname in clients]
 
     def cmd_plotpsd(self, cmd):
         clients = self._get_client_list(cmd)
         for res in self.last_results:
-            clientname = get_attr(res, 'clientname')
-            if clientname in clients and res.samples:
+            clientname = res.clientname
+            if clientname in clients and res.sample_count:
                 rate = float(get_attr(res, 'rate'))
-                vals = np.array([complex(c.r, c.j) for c in res.samples],
-                                dtype=np.complex64)
+                vals = get_samples(res)
                 psd = compute_psd(len(vals), vals)
                 freqs = np.fft.fftshift(np.fft.fftfreq(len(vals), 1/rate))
                 plproc = mp.Process(target=plot_stuff,
@@ -129,10 +273,23 @@ class MeasurementsController:
     def cmd_printres(self, cmd):
         clients = self._get_client_list(cmd)
         for res in self.last_results:
-            clientname = get_attr(res, 'clientname')
+            clientname = res.clientname
             if clientname in clients:
                 print(res)
 
+    def cmd_cancel(self, cmd):
+        # Cancel the call tagged `target` on its clients; without a target,
+        # every call running or queued on the listed clients.
+        if 'target' in cmd:
+            call = self.tagged.get(cmd['target'])
+            if not call:
+                self.logger.warning("No outstanding call tagged '%s'." %
+                                    cmd['target'])
+                return
+            cmd['uuid'] = call.uuid
+            cmd.setdefault('client_list', call.clients)
+        self._rpc_call(cmd)
+
     def cmd_measpaths(self, cmd):
         clients = self._get_client_list(cmd)
         if 'client_list' in cmd:
@@ -141,6 +298,7 @@ class MeasurementsController:
             cmd['get_samples'] = False
         self.logger.info("Running path measurements over clients: %s" % clients)
         toff = cmd['toff'] if 'toff' in cmd else self.DEF_TOFF
+        txtoff = self.HW_TX_TOFF if cmd.get('hwtime') else self.TX_TOFF
         dfile = self._get_datafile()
         if not 'measure_paths' in dfile:
             dfile.create_group('measure_paths')
@@ -156,52 +314,60 @@ class MeasurementsController:
         for txclient in clients:
             rxclients = [x for x in clients if x != txclient]
             txgrp = measgrp.create_group(txclient)
-            stime = rxcmd.start_time = int(time.time())
+            rxcmd.start_time = int(time.time())
             self.logger.info("Running with transmitter: %s" % txclient)
-            txcmd.ClearField("clients")
-            txcmd.clients.append(txclient)
-            rxcmd.ClearField("clients")
-            rxcmd.clients.extend(rxclients)
-            self.pipe.send(rxcmd.SerializeToString())
-            self.cmd_waitres({'client_list': rxclients,
-                              'timeout': cmd['timeout']})
-            for res in self.last_results:
-                rxclient = get_attr(res, 'clientname')
-                sgrp = txgrp.create_group(rxclient)
-                if res.samples:
-                    arr = np.array([complex(c.r, c.j) for c in res.samples],
-                                   dtype=np.complex64)
-                    ds = sgrp.create_dataset('samples', (2,arr.size),
-                                             dtype=arr.dtype)
-                    ds[0] = arr
-                if res.measurements:
-                    arr = np.array(res.measurements, dtype=np.float32)
-                    ds = sgrp.create_dataset('avgpower', (2,arr.size),
-                                             dtype=arr.dtype)
-                    ds[0] = arr
+            rxcall = self._rpc_send(rxcmd, rxclients)
+            self._store_steps(rxcall, txgrp, 0)
+            self.wait_calls([rxcall], cmd['timeout'])
             rxcmd.start_time = np.ceil(time.time()) + toff
-            txcmd.start_time = rxcmd.start_time - self.TX_TOFF
-            self.pipe.send(txcmd.SerializeToString())
-            self.pipe.send(rxcmd.SerializeToString())
-            self.cmd_waitres({'client_list': rxclients + [txclient],
-                              'timeout': cmd['timeout']})
-            for res in self.last_results:
-                rxclient = get_attr(res, 'clientname')
-                if res.samples:
-                    arr = np.array([complex(c.r, c.j) for c in res.samples],
-                                   dtype=np.complex64)
-                    ds = txgrp[rxclient]['samples'][1] = arr
-                if res.measurements:
-                    arr = np.array(res.measurements, dtype=np.float32)
-                    ds = txgrp[rxclient]['avgpower'][1] = arr
+            txcmd.start_time = rxcmd.start_time - txtoff
+            txcall = self._rpc_send(txcmd, [txclient])
+            rxcall = self._rpc_send(rxcmd, rxclients)
+            self._store_steps(rxcall, txgrp, 1)
+            self.wait_calls([txcall, rxcall], cmd['timeout'])
+
+    def _store_steps(self, call, txgrp, row):
+        # Write each step of a seq_measure call to row `row` (0: baseline,
+        # 1: transmitting) of its receiver's datasets as it comes in.
+        call.on_step = lambda res: self._store_step(res, txgrp, row)
+
+    def _store_step(self, res, txgrp, row):
+        sgrp = txgrp.require_group(res.clientname)
+        data = {}
+        if res.sample_count:
+            data['samples'] = get_samples(res, self.ring)
+        if res.measurements:
+            data['avgpower'] = np.array(res.measurements, dtype=np.float32)
+        for (name, arr) in data.items():
+            # Steps are all the same size, so the step number gives the
+            # offset.  The datasets grow as steps arrive.
+            offset = (res.step - 1) * arr.size
+            if name not in sgrp:
+                sgrp.create_dataset(name, (2, 0), maxshape=(2, None),
+                                    dtype=arr.dtype, chunks=True)
+            ds = sgrp[name]
+            if ds.shape[1] < offset + arr.size:
+                ds.resize(offset + arr.size, axis=1)
+            ds[row, offset:offset + arr.size] = arr
+        self.dsfile.flush()
 
     def run(self, cmdfile):
         (c1, c2) = mp.Pipe()
         self.pipe = c1
+        self.ring = self.connector.ring = ShmRing(self.shmsize)
         self.netproc = mp.Process(target=self.connector.run,
                                   args=(c2, self.logger))
         self.netproc.start()
 
+        try:
+            self._run_commands(cmdfile)
+        finally:
+            self.ring.unlink()
+
+        self.logger.info("Done with commands...")
+        self.netproc.join()
+
+    def _run_commands(self, cmdfile):
         # Read in and execute commands
         with open(cmdfile) as cfile:
             commands = json.load(cfile)
@@ -220,15 +386,13 @@ class MeasurementsController:
                 else:
                     self._rpc_call(cmd)
 
-        self.logger.info("Done with commands...")
-        self.netproc.join()
-
     CMD_DISPATCH = {
         "pause":         cmd_pause,
         "wait_results":  cmd_waitres,
         "plot_psd":      cmd_plotpsd,
         "print_results": cmd_printres,
         "measure_paths": cmd_measpaths,
+        "cancel":        cmd_cancel,
     }
 
 
@@ -239,6 +403,8 @@ def parse_args():
     parser.add_argument("-l", "--logfile", type=str, default=DEF_LOGFILE)
     parser.add_argument("-o", "--datadir", type=str, default=DEF_OUTDIR)
     parser.add_argument("-f", "--dfname", type=str, default=DEF_DFNAME)
+    parser.add_argument("--aionet", action="store_true", help="Use the asyncio connector engine")
+    parser.add_argument("--shmsize", type=int, default=DEF_RING_SIZE >> 20, help="Shared memory ring size in MB; bigger results go over the pipe")
     return parser.parse_args()
 
 if __name__ == "__main__":
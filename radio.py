@@ -3,22 +3,110 @@
 # SDR interaction class
 #
 
+import time
+import threading
+import collections
 import uhd
 import numpy as np
 
+from bufpool import BufferPool
+
+class RxRing:
+    """Preallocated sample ring filled by the RX streaming thread.
+
+    `head` counts every sample written since the stream started, so a
+    sample's ring position is just `index % size`.  `anchor` pairs a sample
+    index with the device time the streamer reported for it, which is how
+    timestamps map to indices (and back).
+    """
+    def __init__(self, nsamps, rate, nchans = 1):
+        self.buf = np.zeros((nchans, nsamps), dtype=np.complex64)
+        self.size = nsamps
+        self.rate = rate
+        self.head = 0
+        self.inflight = 0
+        self.anchor = None
+        self.cond = threading.Condition()
+
+    def space(self, maxsamps):
+        # Contiguous view at the head for the streamer to receive into;
+        # `commit()` then publishes what was written.
+        pos = self.head % self.size
+        view = self.buf[:, pos:min(pos + maxsamps, self.size)]
+        self.inflight = view.shape[-1]
+        return view
+
+    def commit(self, nsamps, time_spec = None):
+        with self.cond:
+            if time_spec is not None:
+                self.anchor = (self.head, time_spec)
+            self.head += nsamps
+            self.cond.notify_all()
+
+    def index_at(self, stime):
+        (aidx, atime) = self.anchor
+        return aidx + int(round((stime - atime) * self.rate))
+
+    def time_at(self, idx):
+        (aidx, atime) = self.anchor
+        return atime + (idx - aidx) / self.rate
+
+    def read(self, start, out, timeout):
+        # Waits for [start, start + nsamps) to be written, then copies it
+        # into `out`.  Returns None on timeout or if the writer lapped us.
+        nsamps = out.shape[-1]
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.head >= start + nsamps,
+                                      timeout):
+                return None
+        pos = start % self.size
+        first = min(nsamps, self.size - pos)
+        out[:, :first] = self.buf[:, pos:pos + first]
+        out[:, first:] = self.buf[:, :nsamps - first]
+        if self.head + self.inflight - self.size > start:
+            return None
+        return out
+
 class Radio:
     ASYNC_WAIT = 0.5
-    RX_CLEAR_COUNT = 1000
+    RX_FLUSH_TIME = 0.01  # Seconds of samples drained after a retune.
+    RX_FLUSH_MIN = 4      # ...but never fewer than this many buffers.
     LO_ADJ = 1e6
+    RX_RING_SAMPS = 1 << 23
+    RX_SETTLE_TIME = 0.005  # Discarded after a retune while streaming.
+    RX_WAIT_SLACK = 1.0
+    RX_TIMEOUT = 0.1
+    CMD_LEAD = 0.005  # Timed commands closer than this are issued "now".
+    # Async TX events counted while streaming, by the stats key they bump.
+    TX_EVENTS = {
+        uhd.types.TXMetadataEventCode.underflow: "tx_underflows",
+        uhd.types.TXMetadataEventCode.underflow_in_packet: "tx_underflows",
+        uhd.types.TXMetadataEventCode.seq_error: "tx_seq_errors",
+        uhd.types.TXMetadataEventCode.seq_error_in_packet: "tx_seq_errors",
+        uhd.types.TXMetadataEventCode.time_error: "tx_time_errors",
+    }
 
-    def __init__(self, logger, usrp_args = "", rx_txrx = False, chan = 0):
+    def __init__(self, logger, usrp_args = "", rx_txrx = False, chan = 0,
+                 rxstream = False, rxchans = None):
         self.usrp = uhd.usrp.MultiUSRP(usrp_args)
         self.channel = chan
+        self.rxchans = list(rxchans) if rxchans else [chan]
         if rx_txrx:
             self.usrp.set_rx_antenna("TX/RX")
         self.rxstreamer = None
         self.txstreamer = None
         self.logger = logger
+        self.rxstream = rxstream
+        self.rxring = None
+        self.rxthread = None
+        self.rxrun = False
+        self.rxsettle = 0
+        self.state = {}
+        self.pool = BufferPool()
+        self.txthread = None
+        self.txstop = threading.Event()
+        self.txstats = collections.Counter()
+        self.timesynced = False
         self._setup_streamers()
 
     def _setup_streamers(self):
@@ -26,7 +114,43 @@ class Radio:
         st_args = uhd.usrp.StreamArgs("fc32", "sc16")
         st_args.channels = [self.channel]
         self.txstreamer = self.usrp.get_tx_stream(st_args)
+        self._setup_rxstreamer()
+
+    def _setup_rxstreamer(self):
+        # One streamer for all RX channels keeps their samples aligned.
+        st_args = uhd.usrp.StreamArgs("fc32", "sc16")
+        st_args.channels = self.rxchans
+        self.rxstreamer = None  # A channel can only be in one streamer.
         self.rxstreamer = self.usrp.get_rx_stream(st_args)
+        self.rxscratch = np.empty(len(self.rxchans) *
+                                  self.rxstreamer.get_max_num_samps(),
+                                  dtype=np.complex64)
+
+    def _recv(self, buf, metadata, timeout = RX_TIMEOUT):
+        # UHD receives in place only into C-contiguous arrays; anything
+        # else (a column slice of a multi-channel buffer) it fills through
+        # a temporary copy that is then thrown away.  Receive those into
+        # contiguous scratch space and copy them over.
+        if buf.flags.c_contiguous:
+            return self.rxstreamer.recv(buf, metadata, timeout)
+        (nchans, nsamps) = buf.shape
+        nsamps = min(nsamps, self.rxscratch.size // nchans)
+        scratch = self.rxscratch[:nchans * nsamps].reshape(nchans, nsamps)
+        samps = self.rxstreamer.recv(scratch, metadata, timeout)
+        buf[:, :samps] = scratch[:, :samps]
+        return samps
+
+    def set_rx_channels(self, chans):
+        """Capture from these RX channels, one row each, from now on."""
+        chans = list(chans)
+        if chans == self.rxchans:
+            return
+        streaming = self.rxthread is not None
+        self.stop_rxstream()
+        self.rxchans = chans
+        self._setup_rxstreamer()
+        if streaming:
+            self.start_rxstream()
 
     def _stop_txstreamer(self):
         # Send a mini EOB packet
@@ -34,81 +158,392 @@ class Radio:
         metadata.end_of_burst = True
         self.txstreamer.send(np.zeros((1, 0), dtype=np.complex64), metadata)
 
+    def sync_time(self, pps = False):
+        """Set the device time to host (wall clock) time.
+
+        Once synced, `start_time` arguments are honored in hardware.  With
+        `pps` the time is latched on the next PPS edge, so devices sharing a
+        PPS reference agree to within a sample; otherwise it is set right
+        away, and is only as good as the host clock plus call latency.
+        """
+        streaming = self.rxthread is not None
+        self.stop_rxstream()
+        if pps:
+            last = self.usrp.get_time_last_pps().get_real_secs()
+            while self.usrp.get_time_last_pps().get_real_secs() == last:
+                time.sleep(0.01)
+            self.usrp.set_time_next_pps(
+                uhd.types.TimeSpec(np.floor(time.time()) + 1))
+            time.sleep(1)
+        else:
+            self.usrp.set_time_now(uhd.types.TimeSpec(time.time()))
+        self.timesynced = True
+        if streaming:
+            self.start_rxstream()
+
+    def _time_spec(self, start_time):
+        # TimeSpec to schedule a command at `start_time`, or None to issue
+        # it right away (no synced time, no start time, or too late).
+        if not start_time or not self.timesynced:
+            return None
+        lead = start_time - self.usrp.get_time_now().get_real_secs()
+        if lead < self.CMD_LEAD:
+            self.logger.info("Late: %f" % lead)
+            return None
+        return uhd.types.TimeSpec(start_time)
+
+    def _drain_rxstreamer(self):
+        # Receive and toss samples until the (stopped) streamer runs dry.
+        metadata = uhd.types.RXMetadata()
+        scratch = self.rxscratch.reshape(len(self.rxchans), -1)
+        while self.rxstreamer.recv(scratch, metadata, self.RX_TIMEOUT):
+            pass
+
     def _flush_rxstreamer(self):
         # For collecting metadata from radio command (i.e., errors, etc.)
         metadata = uhd.types.RXMetadata()
         # Figure out the size of the receive buffer and make it
         buffer_samps = self.rxstreamer.get_max_num_samps()
-        recv_buffer = np.empty((1, buffer_samps), dtype=np.complex64)
-        # Loop several times and read samples to clear out gunk.
+        recv_buffer = np.empty((len(self.rxchans), buffer_samps),
+                               dtype=np.complex64)
+        # Read and toss RX_FLUSH_TIME worth of samples to clear out gunk.
+        rate = self.usrp.get_rx_rate(self.rxchans[0])
+        nsamps = max(int(rate * self.RX_FLUSH_TIME),
+                     buffer_samps * self.RX_FLUSH_MIN)
         rx_stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.num_done)
-        rx_stream_cmd.num_samps = buffer_samps * self.RX_CLEAR_COUNT
+        rx_stream_cmd.num_samps = nsamps
         rx_stream_cmd.stream_now = True
         self.rxstreamer.issue_stream_cmd(rx_stream_cmd)
-        for i in range(self.RX_CLEAR_COUNT):
-            samps = self.rxstreamer.recv(recv_buffer, metadata)
+        while nsamps > 0:
+            nsamps -= self.rxstreamer.recv(recv_buffer, metadata)
+            if metadata.error_code == uhd.types.RXMetadataErrorCode.timeout:
+                break
             if metadata.error_code != uhd.types.RXMetadataErrorCode.none:
                 print(metadata.strerror())
-        
+
+    def _rxstream_loop(self):
+        metadata = uhd.types.RXMetadata()
+        buffer_samps = self.rxstreamer.get_max_num_samps()
+        while self.rxrun:
+            samps = self._recv(self.rxring.space(buffer_samps), metadata)
+            if metadata.error_code == uhd.types.RXMetadataErrorCode.overflow:
+                # Samples were dropped; the next time spec re-anchors.
+                self.logger.debug("RX overflow while streaming.")
+            elif metadata.error_code != uhd.types.RXMetadataErrorCode.none:
+                self.logger.warning("RX stream: %s" % metadata.strerror())
+            if samps:
+                tspec = metadata.time_spec.get_real_secs() \
+                    if metadata.has_time_spec else None
+                self.rxring.commit(samps, tspec)
+
+    def start_rxstream(self):
+        """Keep the RX streamer running into a ring buffer.
+
+        Captures (see `capture()`) are then served as slices of the ring
+        instead of with a stream command and flush each.
+        """
+        if self.rxthread:
+            return
+        rate = self.usrp.get_rx_rate(self.rxchans[0])
+        self.rxring = RxRing(self.RX_RING_SAMPS, rate, len(self.rxchans))
+        self.rxsettle = 0
+        rx_stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.start_cont)
+        rx_stream_cmd.stream_now = True
+        self.rxstreamer.issue_stream_cmd(rx_stream_cmd)
+        self.rxrun = True
+        self.rxthread = threading.Thread(target=self._rxstream_loop,
+                                         daemon=True)
+        self.rxthread.start()
+
+    def stop_rxstream(self):
+        if not self.rxthread:
+            return
+        rx_stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.stop_cont)
+        self.rxstreamer.issue_stream_cmd(rx_stream_cmd)
+        self.rxrun = False
+        self.rxthread.join()
+        self.rxthread = None
+        self.rxring = None
+
+    def capture(self, nsamps, start_time = None, out = None):
+        """Return `nsamps` streamed samples and the device time of the first.
+
+        Without `start_time`, the capture starts with the next sample
+        received (but not before the settle point of the last retune).
+        `start_time` is in device time and may lie in the past, as long as
+        the ring still holds it.  Samples land in `out` if given, else in
+        a buffer from the pool.
+        """
+        ring = self.rxring
+        if nsamps > ring.size:
+            raise ValueError("Capture of %d samples exceeds ring size %d" %
+                             (nsamps, ring.size))
+        start = self._ring_start(start_time)
+        if out is None:
+            out = self.pool.get((len(self.rxchans), nsamps))
+        samples = self._ring_read(start, out)
+        stime = ring.time_at(start) if ring.anchor else None
+        return (samples, stime)
+
+    def _ring_start(self, start_time):
+        ring = self.rxring
+        if start_time is not None and ring.anchor:
+            start = ring.index_at(start_time)
+            if start < ring.head - ring.size:
+                self.logger.warning("Capture start %f no longer buffered." %
+                                    start_time)
+                start = ring.head - ring.size // 2
+            return start
+        return max(ring.head, self.rxsettle)
+
+    def _ring_read(self, start, out):
+        ring = self.rxring
+        nsamps = out.shape[-1]
+        wait = (start + nsamps - ring.head) / ring.rate + self.RX_WAIT_SLACK
+        samples = ring.read(start, out, max(wait, self.RX_WAIT_SLACK))
+        if samples is None:
+            raise RuntimeError("RX stream capture of %d samples failed" %
+                               nsamps)
+        return samples
+
+    def _set(self, name, value, setter, *args, chan = None):
+        # Only talk to the device when a setting actually changes.  Returns
+        # whether it did.
+        chan = self.channel if chan is None else chan
+        if self.state.get((name, chan)) == value:
+            return False
+        setter(*args, chan)
+        self.state[(name, chan)] = value
+        return True
+
+    def _set_rx(self, name, value, setter, *args):
+        # The same setting on every RX channel.
+        changed = False
+        for chan in self.rxchans:
+            changed |= self._set(name, value, setter, *args, chan=chan)
+        return changed
+
     def tune(self, freq, gain, rate = None):
         # Push the LO offset outside of sampling freq range
+        if not rate:
+            rate = self.state.get(("rx_rate", self.rxchans[0])) or \
+                self.usrp.get_rx_rate(self.rxchans[0])
         lo_off = rate + self.LO_ADJ
-        # Set the USRP freq, gain, and rate (if provided)
-        self.usrp.set_rx_freq(uhd.types.TuneRequest(freq, lo_off), self.channel)
-        self.usrp.set_rx_gain(gain, self.channel)
-        self.usrp.set_tx_freq(uhd.types.TuneRequest(freq, lo_off), self.channel)
-        self.usrp.set_tx_gain(gain, self.channel)
-        if rate:
-            self.usrp.set_tx_rate(rate, self.channel)
-            self.usrp.set_rx_rate(rate, self.channel)
-        self._flush_rxstreamer()
+        # Set the USRP freq, gain, and rate (skipping what's already set)
+        treq = uhd.types.TuneRequest(freq, lo_off)
+        rxchanged = self._set_rx("rx_freq", (freq, lo_off),
+                                 self.usrp.set_rx_freq, treq)
+        rxchanged |= self._set_rx("rx_gain", gain, self.usrp.set_rx_gain, gain)
+        self._set("tx_freq", (freq, lo_off), self.usrp.set_tx_freq, treq)
+        self._set("tx_gain", gain, self.usrp.set_tx_gain, gain)
+        self._set("tx_rate", rate, self.usrp.set_tx_rate, rate)
+        rxchanged |= self._set_rx_rate(rate)
+        if self.rxstream:
+            # Streaming: drop the samples taken while the LO settles rather
+            # than draining the streamer.
+            self.start_rxstream()
+            if rxchanged:
+                self.rxsettle = self.rxring.head + \
+                    int(self.rxring.rate * self.RX_SETTLE_TIME)
+        elif rxchanged:
+            self._flush_rxstreamer()
+
+    def _set_rx_rate(self, rate):
+        # The ring's index/time mapping assumes a fixed rate, so a rate
+        # change restarts the stream.
+        if all(self.state.get(("rx_rate", chan)) == rate
+               for chan in self.rxchans):
+            return False
+        restart = self.rxthread is not None
+        if restart:
+            self.stop_rxstream()
+        self._set_rx("rx_rate", rate, self.usrp.set_rx_rate, rate)
+        if restart:
+            self.start_rxstream()
+        return True
 
-    def recv_samples(self, nsamps, rate = None):
+    def release(self, samples):
+        """Hand a buffer from `recv_samples()` back for reuse."""
+        self.pool.put(samples)
+
+    def recv_samples(self, nsamps, rate = None, start_time = None,
+                     out = None):
+        # Returns one row of samples per RX channel.
         # Set the sampling rate if necessary
         if rate:
-            self.usrp.set_rx_rate(rate, self.channel)
+            self._set_rx_rate(rate)
 
-        # Create the array to hold the return samples.
-        samples = np.empty((1, nsamps), dtype=np.complex64)
+        # The array to hold the return samples: caller supplied, or pooled
+        # (see `release()`).
+        samples = out if out is not None else \
+            self.pool.get((len(self.rxchans), nsamps))
 
-        # For collecting metadata from radio command (i.e., errors, etc.)
-        metadata = uhd.types.RXMetadata()
+        if self.rxthread:
+            if not self.timesynced:
+                start_time = None
+            return self.capture(nsamps, start_time, samples)[0]
 
-        # Figure out the size of the receive buffer and make it
-        buffer_samps = self.rxstreamer.get_max_num_samps()
-        recv_buffer = np.zeros((1, buffer_samps), dtype=np.complex64)
+        timeout = self._issue_rx(nsamps, start_time)
+        self._recv_into(samples, timeout)
+
+        # Done.  Return samples.
+        return samples
+
+    def recv_chunks(self, nsamps, chunk, rate = None, start_time = None):
+        """Receive `nsamps` samples, handing them out `chunk` at a time.
+
+        A generator, for captures too big to hold in memory.  Every chunk
+        is a view of the same buffer, valid only until the next one.
+        """
+        if rate:
+            self._set_rx_rate(rate)
+        buf = self.pool.get((len(self.rxchans), chunk))
+        done = 0
+        try:
+            if self.rxthread:
+                start = self._ring_start(start_time if self.timesynced
+                                         else None)
+                while done < nsamps:
+                    view = buf[:, :min(chunk, nsamps - done)]
+                    done += view.shape[-1]
+                    yield self._ring_read(start + done - view.shape[-1], view)
+            else:
+                timeout = self._issue_rx(nsamps, start_time)
+                while done < nsamps:
+                    view = buf[:, :min(chunk, nsamps - done)]
+                    self._recv_into(view, timeout)
+                    timeout = self.RX_TIMEOUT
+                    done += view.shape[-1]
+                    yield view
+        finally:
+            if done < nsamps and not self.rxthread:
+                # Abandoned early; stop the stream and drop what is still
+                # in flight, or the next capture would start with it.
+                rx_stream_cmd = uhd.types.StreamCMD(
+                    uhd.types.StreamMode.stop_cont)
+                self.rxstreamer.issue_stream_cmd(rx_stream_cmd)
+                self._drain_rxstreamer()
+            self.pool.put(buf)
 
-        # Set up the device to receive exactly `nsamps` samples.
+    def _issue_rx(self, nsamps, start_time):
+        # Set up the device to receive exactly `nsamps` samples, starting
+        # at `start_time` if we can.  Returns the timeout for the first
+        # recv().
         rx_stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.num_done)
         rx_stream_cmd.num_samps = nsamps
-        rx_stream_cmd.stream_now = True
+        tspec = self._time_spec(start_time)
+        timeout = self.RX_TIMEOUT
+        if tspec:
+            rx_stream_cmd.stream_now = False
+            rx_stream_cmd.time_spec = tspec
+            timeout += start_time - time.time()
+        else:
+            rx_stream_cmd.stream_now = True
         self.rxstreamer.issue_stream_cmd(rx_stream_cmd)
-        
-        # Loop until we get the number of samples requested.  Append each
-        # batch received to the return array.
+        return timeout
+
+    def _recv_into(self, samples, timeout):
+        # For collecting metadata from radio command (i.e., errors, etc.)
+        metadata = uhd.types.RXMetadata()
+        # Loop until `samples` is full, receiving each batch into the rest
+        # of it.
+        nsamps = samples.shape[-1]
         recv_samps = 0
         while recv_samps < nsamps:
-            samps = self.rxstreamer.recv(recv_buffer, metadata)
+            samps = self._recv(samples[:, recv_samps:], metadata, timeout)
+            timeout = self.RX_TIMEOUT
 
             if metadata.error_code != uhd.types.RXMetadataErrorCode.none:
                 print(metadata.strerror())
-            if samps:
-                real_samps = min(nsamps - recv_samps, samps)
-                samples[:, recv_samps:recv_samps + real_samps] = \
-                    recv_buffer[:, 0:real_samps]
-                recv_samps += real_samps
+            recv_samps += samps
 
-        # Done.  Return samples.
-        return samples
+    def _tx_event(self, as_meta):
+        key = self.TX_EVENTS.get(as_meta.event_code)
+        if key:
+            self.txstats[key] += 1
+        elif as_meta.event_code != uhd.types.TXMetadataEventCode.burst_ack:
+            self.logger.debug("Async error code: %s", as_meta.event_code)
+
+    def _txstream_loop(self, waveform, end_time, tspec):
+        max_tx_samps = self.txstreamer.get_max_num_samps()
+        period = waveform.shape[-1]
+        # Enough periods back to back that a full packet starting anywhere
+        # in the first period is one contiguous slice.
+        reps = int(np.ceil(max_tx_samps / period)) + 1
+        txbuf = np.tile(waveform.astype(np.complex64, copy=False), (1, reps))
+        meta = uhd.types.TXMetadata()
+        meta.start_of_burst = True
+        if tspec:
+            meta.has_time_spec = True
+            meta.time_spec = tspec
+        as_meta = uhd.types.TXAsyncMetadata()
+        offset = 0
+        while not self.txstop.is_set() and \
+              (end_time is None or time.time() < end_time):
+            sent = self.txstreamer.send(txbuf[:, offset:offset + max_tx_samps],
+                                        meta)
+            meta.start_of_burst = False
+            meta.has_time_spec = False
+            offset = (offset + sent) % period
+            self.txstats["tx_samples"] += sent
+            while self.txstreamer.recv_async_msg(as_meta, 0):
+                self._tx_event(as_meta)
+        self._stop_txstreamer()
+        # Collect the remaining events, up to the ack of our end of burst.
+        while self.txstreamer.recv_async_msg(as_meta, self.ASYNC_WAIT):
+            if as_meta.event_code == uhd.types.TXMetadataEventCode.burst_ack:
+                break
+            self._tx_event(as_meta)
+        else:
+            self.logger.info("Timed out waiting for TX async.")
+
+    def start_txstream(self, waveform, end_time = None, start_time = None):
+        """Transmit `waveform` on repeat, without gaps, from a thread.
+
+        Runs until `end_time` (host time) or `stop_txstream()`; with a
+        synced device clock the burst starts at `start_time`.  `waveform`
+        should hold a whole number of periods so the repeats join up.
+        """
+        self.stop_txstream()
+        self.txstop.clear()
+        self.txstats = collections.Counter(
+            dict.fromkeys(["tx_samples"] + list(self.TX_EVENTS.values()), 0))
+        self.txthread = threading.Thread(
+            target=self._txstream_loop, daemon=True,
+            args=(waveform, end_time, self._time_spec(start_time)))
+        self.txthread.start()
 
-    def send_samples(self, samples, rate = None):
+    def wait_txstream(self):
+        """Wait for the TX stream to end; returns its sample/event counts."""
+        if self.txthread:
+            self.txthread.join()
+            self.txthread = None
+        return dict(self.txstats)
+
+    def stop_txstream(self):
+        self.txstop.set()
+        return self.wait_txstream()
+
+    def cancel(self):
+        """Cut a running TX stream short; safe to call from any thread."""
+        self.txstop.set()
+
+    def send_samples(self, samples, rate = None, start_time = None):
         # Set the sampling rate if necessary
         if rate:
-            self.usrp.set_tx_rate(rate, self.channel)
+            self._set("tx_rate", rate, self.usrp.set_tx_rate, rate)
 
-        # Metadata for the TX command
+        # Metadata for the TX command.  A timed burst is held by the device
+        # until `start_time`.
         meta = uhd.types.TXMetadata()
-        meta.has_time_spec = False
+        tspec = self._time_spec(start_time)
+        async_wait = self.ASYNC_WAIT
+        if tspec:
+            meta.has_time_spec = True
+            meta.time_spec = tspec
+            async_wait += start_time - time.time()
+        else:
+            meta.has_time_spec = False
         meta.start_of_burst = True
 
         # Metadata from "async" status call
@@ -128,7 +563,9 @@ class Radio:
                 tx_buffer[:, nsamps:] = 0. + 0.j
                 meta.end_of_burst = True
             tx_samps += self.txstreamer.send(tx_buffer, meta)
-        if self.txstreamer.recv_async_msg(as_meta, self.ASYNC_WAIT):
+            meta.has_time_spec = False
+            meta.start_of_burst = False
+        if self.txstreamer.recv_async_msg(as_meta, async_wait):
             if as_meta.event_code != uhd.types.TXMetadataEventCode.burst_ack:
                 self.logger.debug("Async error code: %s", as_meta.event_code)
         else:
@@ -2,49 +2,120 @@
 #
 # Measurement client/server RPC call definitions
 #
+import numpy as np
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
 import measurements_pb2 as measpb
 
 RPCCALLS = {}
+DEF_SAMPLE_DTYPE = np.complex64
+
+# Protobuf field types for the python types used in call schemas.
+FDP = descriptor_pb2.FieldDescriptorProto
+ARG_PBTYPES = {
+    int:   FDP.TYPE_INT64,
+    float: FDP.TYPE_DOUBLE,
+    bool:  FDP.TYPE_BOOL,
+    str:   FDP.TYPE_STRING,
+}
+ARGS_POOL = descriptor_pool.DescriptorPool()
 
 def get_attr(msg, key):
     for kv in msg.attributes:
         if kv.key == key: return kv.val
     return None
 
+def set_attr(msg, key, val):
+    for kv in msg.attributes:
+        if kv.key == key:
+            kv.val = str(val)
+            return
+    add_attr(msg, key, val)
+
 def add_attr(msg, key, val):
     attr = msg.attributes.add()
     attr.key = key
     attr.val = str(val)
+
+def add_samples(msg, samples):
+    # Append raw sample buffer (no per-sample conversion).
+    samples = np.ascontiguousarray(samples)
+    if not msg.sample_dtype:
+        msg.sample_dtype = samples.dtype.name
+    if msg.sample_count:
+        msg.sample_data += samples.tobytes()
+    else:
+        msg.sample_data = samples.tobytes()
+    msg.sample_count += samples.size
+
+def get_samples(msg, ring = None):
+    # Zero-copy view of the packed samples (empty if there are none).
+    # Samples stashed in `ring` are viewed in place, until released.
+    dtype = msg.sample_dtype if msg.sample_dtype else DEF_SAMPLE_DTYPE
+    buf = msg.sample_data
+    if ring and msg.HasField("shm"):
+        buf = ring.get(msg.shm)
+    return np.frombuffer(buf, dtype=dtype, count=msg.sample_count)
     
+def mk_args_class(funcname, funcargs):
+    # Build a (proto2, so unset fields are detectable) message type with
+    # one optional field per argument, numbered in schema order.
+    fdp = descriptor_pb2.FileDescriptorProto()
+    fdp.name = "rpcargs/%s.proto" % funcname
+    fdp.package = "measurements.rpcargs"
+    fdp.syntax = "proto2"
+    mdp = fdp.message_type.add()
+    mdp.name = "%sArgs" % funcname
+    for num, (aname, adict) in enumerate(funcargs.items(), 1):
+        field = mdp.field.add()
+        field.name = aname
+        field.number = num
+        field.type = ARG_PBTYPES[adict['type']]
+        field.label = FDP.LABEL_OPTIONAL
+    ARGS_POOL.Add(fdp)
+    mdesc = ARGS_POOL.FindMessageTypeByName("%s.%s" % (fdp.package, mdp.name))
+    if hasattr(message_factory, "GetMessageClass"):
+        return message_factory.GetMessageClass(mdesc)
+    return message_factory.MessageFactory(ARGS_POOL).GetPrototype(mdesc)
+
 class RPCCall:
     def __init__(self, funcname, funcargs = {}):
         self.funcname = funcname
         self.funcargs = funcargs
+        self.argclass = mk_args_class(funcname, funcargs)
+        self.argtypes = {aname: adict['type']
+                         for aname, adict in funcargs.items()}
+        self.defaults = {aname: adict['default']
+                         for aname, adict in funcargs.items()}
 
     def encode(self, **kwargs):
         cmsg = measpb.SessionMsg()
         cmsg.type = measpb.SessionMsg.CALL
-        add_attr(cmsg, 'funcname', self.funcname)
-        for aname,adict in self.funcargs.items():
-            if aname in kwargs:
-                add_attr(cmsg, aname, kwargs[aname])
+        cmsg.funcname = self.funcname
+        args = self.argclass()
+        for aname, atype in self.argtypes.items():
+            if aname in kwargs and kwargs[aname] is not None:
+                setattr(args, aname, atype(kwargs[aname]))
+        cmsg.call_args = args.SerializeToString()
         return cmsg
 
     def decode(self, cmsg):
-        argdict = {}
+        args = self.argclass()
+        args.ParseFromString(cmsg.call_args)
+        argdict = dict(self.defaults)
+        argdict.update((fdesc.name, val) for fdesc, val in args.ListFields())
         argdict['start_time'] = cmsg.start_time
-        cattrs = {kv.key: kv.val for kv in cmsg.attributes}
-        for aname,adict in self.funcargs.items():
-            if aname in cattrs:
-                if adict['type'] == bool:
-                    argdict[aname] = True if cattrs[aname] == 'True' else False
-                else:
-                    argdict[aname] = adict['type'](cattrs[aname])
-            else:
-                argdict[aname] = adict['default']
         return argdict
 
-    
+
+RPCCALLS['echo'] = RPCCall('echo', {})
+
+# Cancel a running or queued call by uuid; 0 cancels them all.
+RPCCALLS['cancel'] = \
+    RPCCall('cancel',
+            {
+                'uuid':      {'type': int, 'default': 0},
+            })
+
 RPCCALLS['txsine'] = \
     RPCCall('txsine',
             {
@@ -63,17 +134,22 @@ RPCCALLS['rxsamples'] = \
                 'freq':      {'type': float, 'default': None},
                 'gain':      {'type': float, 'default': 30.0},
                 'rate':      {'type': float, 'default': 1e6},
+                'channels':  {'type': str, 'default': ''},
             })
 
 RPCCALLS['measure_power'] = \
     RPCCall('measure_power',
             {
                 'nsamps':    {'type': int, 'default': 256},
+                'get_samples': {'type': bool, 'default': False},
                 'filter_bw': {'type': float, 'default': 1e4},
                 'freq':      {'type': float, 'default': None},
                 'gain':      {'type': float, 'default': 30.0},
                 'rate':      {'type': float, 'default': 1e6},
                 'wfreq':     {'type': float, 'default': 1e5},
+                'channels':  {'type': str, 'default': ''},
+                'power_method': {'type': str, 'default': 'butter'},
+                'reduce':    {'type': str, 'default': ''},
             })
 
 RPCCALLS['seq_measure'] = \
@@ -87,6 +163,9 @@ RPCCALLS['seq_measure'] = \
                 'rate':      {'type': float, 'default': 1e6},
                 'freq_step': {'type': float, 'default': 5e4},
                 'time_step': {'type': float, 'default': 1},
+                'channels':  {'type': str, 'default': ''},
+                'power_method': {'type': str, 'default': 'butter'},
+                'reduce':    {'type': str, 'default': ''},
             })
 
 RPCCALLS['seq_transmit'] = \
@@ -109,4 +188,5 @@ RPCCALLS['seq_rxsamples'] = \
                 'rate':      {'type': float, 'default': 1e6},
                 'freq_step': {'type': float, 'default': 5e4},
                 'time_step': {'type': float, 'default': 1},
+                'channels':  {'type': str, 'default': ''},
             })
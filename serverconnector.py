@@ -7,13 +7,17 @@ import logging
 import time
 import socket
 import selectors
-import struct
 import random
-import select
+import fnmatch
+import re
 import ipaddress
+import collections
 import multiprocessing as mp
 
 import measurements_pb2 as measpb
+from framing import FrameReader, pack_frame
+from shmring import stash_samples
+from spool import result_key, mk_ack
 
 IPRANGES = ['127.0.0.0/8', '155.98.32.0/20']
 
@@ -24,17 +28,97 @@ class Client:
         self.sid = sid
         self.name = name
         self.conn = conn
+        self.fd = conn.fileno()
         self.last = time.time()
 
+class ClientRegistry:
+    """Connected clients, indexed by socket fd, name and session id.
+
+    `select()` resolves a client list from a CALL (exact names, "all", or
+    shell-style group patterns such as "cbrssdr1-*") in a single pass.
+    """
+    def __init__(self):
+        self.by_fd = {}
+        self.by_name = {}
+        self.by_sid = {}
+
+    def __len__(self):
+        return len(self.by_fd)
+
+    def __iter__(self):
+        return iter(list(self.by_fd.values()))
+
+    def add(self, cli):
+        # A client reconnecting under the same name or sid replaces its
+        # old (dead) connection, so calls don't go out on both.
+        for old in (self.by_name.get(cli.name), self.by_sid.get(cli.sid)):
+            if old:
+                self.remove(old.fd)
+        self.remove(cli.fd)
+        self.by_fd[cli.fd] = cli
+        self.by_name[cli.name] = cli
+        self.by_sid[cli.sid] = cli
+
+    def remove(self, fd):
+        # Only drop name/sid entries that still point at this client (it
+        # may already have reconnected on a new socket).
+        cli = self.by_fd.pop(fd, None)
+        if cli:
+            if self.by_name.get(cli.name) is cli:
+                del self.by_name[cli.name]
+            if self.by_sid.get(cli.sid) is cli:
+                del self.by_sid[cli.sid]
+        return cli
+
+    def get_fd(self, fd):
+        return self.by_fd.get(fd)
+
+    def get_name(self, name):
+        return self.by_name.get(name)
+
+    def get_sid(self, sid):
+        return self.by_sid.get(sid)
+
+    def select(self, names):
+        if "all" in names:
+            return list(self.by_fd.values())
+        selected = {}
+        patterns = []
+        for name in names:
+            if any(c in name for c in "*?["):
+                patterns.append(fnmatch.translate(name))
+            elif name in self.by_name:
+                cli = self.by_name[name]
+                selected[cli.fd] = cli
+        if patterns:
+            match = re.compile("|".join(patterns)).match
+            for cname, cli in self.by_name.items():
+                if match(cname):
+                    selected[cli.fd] = cli
+        return list(selected.values())
+
+class ConnState:
+    # Per-socket receive buffer and outgoing frame queue.
+    def __init__(self, peerinfo):
+        self.peerinfo = peerinfo
+        self.reader = FrameReader()
+        self.wqueue = collections.deque()
+        self.writing = False
+
 class ServerConnector:
     LISTEN_IP = '0.0.0.0'
     LISTEN_PORT = 5555
     BACKLOG = 10
+    MAX_IOV = 64
+    ACK_HISTORY = 8192
 
     CALL_GETCLIENTS = "getclients"
 
     def __init__(self):
-        self.clients = {}
+        self.clients = ClientRegistry()
+        self.conns = {}
+        self.acked = collections.defaultdict(collections.OrderedDict)
+        self.ring = None
         self.pipe = None
         self.logger = None
         self.sel = selectors.DefaultSelector()
@@ -50,115 +134,160 @@ class ServerConnector:
         lsock.setblocking(False)
         self.sel.register(lsock, selectors.EVENT_READ, self._accept)
 
-    def _accept(self, sock, mask):
-        (conn, addr) = sock.accept()
-        (ip, port) = conn.getpeername()
+    def _valid_ip(self, ip):
         ipobj = ipaddress.IPv4Address(ip)
-        validip = False
         for iprange in self.ipranges:
             if ipobj in iprange:
-                validip = True
-                break
-        if not validip:
+                return True
+        return False
+
+    def _accept(self, sock, mask):
+        (conn, addr) = sock.accept()
+        (ip, port) = conn.getpeername()
+        if not self._valid_ip(ip):
             self.logger.info("Rejected connection from %s" % ip)
             conn.close()
             return
         self.logger.info("Accepted connection: %s:%s" % (ip, port))
         conn.setblocking(False)
-        self.sel.register(conn, selectors.EVENT_READ, self._readsock)
+        self.conns[conn] = ConnState((ip, port))
+        self.sel.register(conn, selectors.EVENT_READ, self._sockevent)
+
+    def _sockevent(self, conn, mask):
+        if mask & selectors.EVENT_WRITE:
+            self._flush(conn)
+        if mask & selectors.EVENT_READ and conn in self.conns:
+            self._readsock(conn, mask)
 
     def _readsock(self, conn, mask):
-        msg = self._get_msg_from_sock(conn)
-        if msg:
-            self.DISPATCH[msg.type](self, msg, conn)
+        cstate = self.conns[conn]
+        if cstate.reader.recv_from(conn):
+            # Dispatch only fully reassembled messages; stop if one of them
+            # closed the connection.
+            for msg in cstate.reader.get_messages():
+                self.DISPATCH[msg.type](self, msg, conn)
+                if conn not in self.conns:
+                    break
         else:
-            peerinfo = conn.getpeername()
             self.logger.warning("Connection to %s:%s closed unexpectedly." %
-                                peerinfo)
-            self.sel.unregister(conn)
-            conn.close()
-            if repr(peerinfo) in self.clients:
-                del(self.clients[repr(peerinfo)])
+                                cstate.peerinfo)
+            self._close_conn(conn)
+
+    def _close_conn(self, conn):
+        self.clients.remove(conn.fileno())
+        self.sel.unregister(conn)
+        conn.close()
+        del self.conns[conn]
+
+    def _queue_frame(self, conn, frame):
+        # Frames are immutable and may be shared between many client queues.
+        cstate = self.conns[conn]
+        cstate.wqueue.append(frame)
+        if not cstate.writing:
+            self._flush(conn)
+            if cstate.wqueue and conn in self.conns:
+                self.sel.modify(conn, selectors.EVENT_READ |
+                                selectors.EVENT_WRITE, self._sockevent)
+                cstate.writing = True
+
+    def _flush(self, conn):
+        cstate = self.conns[conn]
+        wqueue = cstate.wqueue
+        while wqueue:
+            bufs = [wqueue[i] for i in range(min(len(wqueue), self.MAX_IOV))]
+            try:
+                sent = conn.sendmsg(bufs)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError as e:
+                self.logger.warning("Send to %s:%s failed: %s" %
+                                    (*cstate.peerinfo, e))
+                self._close_conn(conn)
+                return
+            # Drop fully sent frames; keep a view of a partially sent one.
+            while sent:
+                flen = len(wqueue[0])
+                if sent >= flen:
+                    wqueue.popleft()
+                    sent -= flen
+                else:
+                    wqueue[0] = memoryview(wqueue[0])[sent:]
+                    sent = 0
+        if cstate.writing:
+            self.sel.modify(conn, selectors.EVENT_READ, self._sockevent)
+            cstate.writing = False
 
     def _readpipe(self, pipe, mask):
             msg = measpb.SessionMsg()
             msg.ParseFromString(pipe.recv())
             self.DISPATCH[msg.type](self, msg, pipe)
 
-    def _get_msg_from_sock(self, conn):
-        smsg = None
-        ldata = conn.recv(4)
-        if ldata:
-            mlen = struct.unpack(">L", ldata)[0]
-            mbuf = bytearray()
-            while len(mbuf) < mlen:
-                rd, wt, xt = select.select([conn], [], [], 1)
-                if not rd:
-                    self.logger.warning("No data ready for read from socket.")
-                mbuf += conn.recv(mlen - len(mbuf))
-            self.logger.debug("Received %d, indicated size %d." % (len(mbuf), mlen))
-            smsg = measpb.SessionMsg()
-            smsg.ParseFromString(mbuf)
-        return smsg
-
     def _send_msg(self, conn, msg):
-        smsg = msg.SerializeToString()
         if isinstance(conn, mp.connection.Connection):
-            conn.send(smsg)
+            conn.send(msg.SerializeToString())
         else:
-            packed_len = struct.pack(">L", len(smsg))
-            conn.sendall(packed_len + smsg)
-
-    def _get_client_with_sid(self, sid):
-        for cli in self.clients.values():
-            if cli.sid == sid: return cli
-        return None
-
-    def _get_client_with_name(self, name):
-        for cli in self.clients.values():
-            if cli.name == name: return cli
-        return None
-
-    def _get_attr(self, msg, key):
-        for kv in msg.attributes:
-            if kv.key == key: return kv.val
-        return None
+            self._queue_frame(conn, pack_frame(msg))
 
     def handle_init(self, msg, conn):
         sid = msg.sid
         if not sid:
             sid = random.getrandbits(31)
-        name = self._get_attr(msg, "clientname")
+        name = msg.clientname
         peerinfo = conn.getpeername()
         self.logger.info("INIT message from %s:%s" % peerinfo)
-        self.clients[repr(peerinfo)] = Client(*peerinfo, sid, name, conn)
+        self.clients.add(Client(*peerinfo, sid, name, conn))
         msg.sid = sid
         self._send_msg(conn, msg)
 
     def handle_call(self, msg, conn):
-        func = self._get_attr(msg, "funcname")
-        clients = msg.clients
-        msg.ClearField("clients")
+        func = msg.funcname
         if func in self.CALLS:
             # Handle calls meant for the connector (this class).
             self._send_msg(conn, self.CALLS[func](self, msg))
-        elif clients:
-            # Send along calls destined for measurement clients.
-            if clients[0] == "all":
-                self.logger.debug("Sending '%s' call to all clients" % func)
-                for cli in self.clients.values():
-                    self._send_msg(cli.conn, msg)
-            else:
-                self.logger.debug("Sending '%s' call to clients: %s" % (func, clients))
-                for cname in clients:
-                    cli = self._get_client_with_name(cname)
-                    self._send_msg(cli.conn, msg)
+            return
+        clients = list(msg.clients)
+        msg.ClearField("clients")
+        if clients:
+            # Send along calls destined for measurement clients.  The frame
+            # is serialized once and shared by every client's send queue.
+            frame = pack_frame(msg)
+            targets = self.clients.select(clients)
+            self.logger.debug("Sending '%s' call to clients: %s" %
+                              (func, [cli.name for cli in targets]))
+            if not targets:
+                self.logger.warning("No connected clients match: %s" % clients)
+            for cli in targets:
+                self._queue_frame(cli.conn, frame)
 
     def handle_result(self, msg, conn):
-        # Just pass up to measurements controller for now.
-        cli = self.clients[repr(conn.getpeername())]
-        self.logger.debug("Passing along result from client %s" % cli.sid)
-        self._send_msg(self.pipe, msg)
+        # Pass up to measurements controller and acknowledge.  Clients
+        # replay unacknowledged results after reconnecting, so drop any we
+        # already passed along.  Results without a call uuid can't be told
+        # apart, so those all pass.
+        cli = self.clients.get_fd(conn.fileno())
+        if not cli:
+            # No INIT on this socket (yet).  Leave the result unacked so
+            # the client replays it once it has registered.
+            self.logger.warning("Dropping result on unregistered connection %d"
+                                % conn.fileno())
+            return
+        acked = self.acked[cli.sid]
+        key = result_key(msg)
+        if msg.uuid and key in acked:
+            self.logger.debug("Duplicate result %s from client %s" %
+                              (key, cli.sid))
+        else:
+            self.logger.debug("Passing along result from client %s" % cli.sid)
+            stash_samples(self.ring, msg, logger=self.logger)
+            self._send_msg(self.pipe, msg)
+            if msg.uuid:
+                acked[key] = True
+                if len(acked) > self.ACK_HISTORY:
+                    acked.popitem(last=False)
+        self._send_msg(conn, mk_ack(msg))
+
+    def handle_ack(self, msg, conn):
+        pass
 
     def handle_hb(self, msg, conn):
         pass
@@ -166,16 +295,17 @@ class ServerConnector:
     def handle_close(self, msg, conn):
         peerinfo = conn.getpeername()
         self.logger.info("CLOSE message from %s:%s" % peerinfo)
-        self.sel.unregister(conn)
-        conn.close()
-        if repr(peerinfo) in self.clients:
-            del(self.clients[repr(peerinfo)])
+        self._close_conn(conn)
 
     def get_clients(self, msg):
         rmsg = measpb.SessionMsg()
-        #rmsg.uuid = msg.uuid
+        rmsg.uuid = msg.uuid
         rmsg.type = measpb.SessionMsg.RESULT
-        rmsg.clients.extend([cli.name for cli in self.clients.values()])
+        if msg.clients:
+            clients = self.clients.select(msg.clients)
+        else:
+            clients = self.clients
+        rmsg.clients.extend([cli.name for cli in clients])
         return rmsg
 
     def run(self, pipe, logger):
@@ -200,4 +330,5 @@ class ServerConnector:
         measpb.SessionMsg.RESULT: handle_result,
         measpb.SessionMsg.HB: handle_hb,
         measpb.SessionMsg.CLOSE: handle_close,
+        measpb.SessionMsg.ACK: handle_ack,
     }
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# Shared memory ring buffer for moving bulk sample payloads between a
+# connector process and its worker without pushing them through mp.Pipe.
+#
+
+import struct
+from multiprocessing import shared_memory
+
+import measurements_pb2 as measpb
+
+DEF_RING_SIZE = 128 * 1024 * 1024
+SHM_MIN = 64 * 1024
+
+class ShmRing:
+    """Single-producer/single-consumer byte ring in shared memory.
+
+    The producer copies a payload in with `put()` and sends the returned
+    ShmRef over the pipe in place of the data; the consumer reads it with
+    `get()` and hands the space back with `release()`.  Payloads are
+    consumed in the order they were put (the pipe preserves that order), so
+    releasing just advances the tail to the end of that payload.  A payload
+    never wraps: if it doesn't fit before the end of the ring, it starts
+    over at offset 0.
+    """
+    HDR_FMT = "QQ"  # head (producer), tail (consumer); total bytes so far
+    HDR_SIZE = 64
+
+    def __init__(self, size = DEF_RING_SIZE):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=self.HDR_SIZE + size)
+        struct.pack_into(self.HDR_FMT, self.shm.buf, 0, 0, 0)
+
+    def _get_hdr(self):
+        return struct.unpack_from(self.HDR_FMT, self.shm.buf, 0)
+
+    def put(self, data):
+        # Returns a ShmRef, or None if there is no room right now (callers
+        # then just send the payload inline).
+        nbytes = len(data)
+        (head, tail) = self._get_hdr()
+        pos = head % self.size
+        pad = self.size - pos if pos + nbytes > self.size else 0
+        if pad + nbytes > self.size - (head - tail):
+            return None
+        start = head + pad
+        offset = start % self.size
+        dstart = self.HDR_SIZE + offset
+        self.shm.buf[dstart:dstart + nbytes] = data
+        struct.pack_into("Q", self.shm.buf, 0, start + nbytes)
+        ref = measpb.SessionMsg.ShmRef()
+        ref.offset = offset
+        ref.size = nbytes
+        ref.end = start + nbytes
+        return ref
+
+    def get(self, ref):
+        # View into the ring; only valid until `release(ref)`.
+        dstart = self.HDR_SIZE + ref.offset
+        return self.shm.buf[dstart:dstart + ref.size]
+
+    def release(self, ref):
+        struct.pack_into("Q", self.shm.buf, 8, ref.end)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def stash_samples(ring, msg, minsize = SHM_MIN, logger = None):
+    """Move a message's sample payload into `ring`, if it's worth it."""
+    nbytes = len(msg.sample_data)
+    if not ring or nbytes < minsize:
+        return False
+    ref = ring.put(msg.sample_data)
+    if not ref:
+        if logger:
+            why = "too big for" if nbytes > ring.size else "no room in"
+            logger.warning("%d byte payload %s %d byte shared memory ring;"
+                           " sending it over the pipe." %
+                           (nbytes, why, ring.size))
+        return False
+    msg.ClearField("sample_data")
+    msg.shm.CopyFrom(ref)
+    return True
+
+def unstash_samples(ring, msg):
+    """Pull a stashed sample payload back into `msg` and free its space."""
+    if not msg.HasField("shm"):
+        return
+    with ring.get(msg.shm) as view:
+        msg.sample_data = bytes(view)
+    ring.release(msg.shm)
+    msg.ClearField("shm")
+
+def release_samples(ring, msg):
+    """Free a stashed payload read in place with get_samples(msg, ring).
+    Space is freed in order, so release payloads in the order received."""
+    if not msg.HasField("shm"):
+        return
+    ring.release(msg.shm)
+    msg.ClearField("shm")
@@ -1,30 +1,222 @@
 #!/usr/bin/env python3
 
+import functools
+import fractions
 import numpy as np
 import scipy.signal as sig
+import scipy.fft
 import matplotlib.pyplot as plt
 
+FILTER_CACHE_SIZE = 256
+WINDOW_CACHE_SIZE = 32
+FFT_WORKERS = -1  # scipy.fft threads for batched transforms; -1: all CPUs
+WAVE_CACHE_SIZE = 64
+CHANNELIZER_TAPS = 8  # Prototype filter taps per sub-band
+
+class NCO:
+    """Phase-continuous tone (or comb of tones) generator.
+
+    Each `fill()` writes the next samples into a caller's buffer, picking
+    up the phase where the previous one stopped, so a waveform can be
+    produced chunk by chunk into one reusable buffer.
+    """
+    def __init__(self, wfreqs, wampls, srate):
+        self.wfreqs = np.atleast_1d(np.asarray(wfreqs, dtype=np.float64))
+        self.wampls = np.broadcast_to(np.asarray(wampls, dtype=np.float64),
+                                      self.wfreqs.shape)
+        self.incs = 2 * np.pi * self.wfreqs / srate
+        self.phases = np.zeros(self.wfreqs.shape)
+        self.ramp = np.arange(0)
+
+    def fill(self, out):
+        nsamps = out.shape[-1]
+        if self.ramp.size < nsamps:
+            self.ramp = np.arange(nsamps, dtype=np.float64)
+        ramp = self.ramp[:nsamps]
+        out[...] = 0
+        for (inc, ampl, phase) in zip(self.incs, self.wampls, self.phases):
+            out[...] += ampl * np.exp(1j * (phase + inc * ramp))
+        self.phases = (self.phases + self.incs * nsamps) % (2 * np.pi)
+        return out
+
+    def generate(self, nsamps, dtype = np.complex64):
+        return self.fill(np.empty((1, nsamps), dtype=dtype))
+
 def mk_sine(nsamps, wampl, wfreq, srate):
-    vals = np.ones((1,nsamps), dtype=np.complex64) * np.arange(nsamps)
-    return wampl * np.exp(vals * 2j * np.pi * wfreq/srate)
+    return NCO(wfreq, wampl, srate).generate(nsamps)
+
+def periodic_len(wfreq, srate, maxlen):
+    # Fewest samples holding a whole number of cycles of `wfreq` (up to
+    # `maxlen`; beyond that the repeat is only approximately seamless).
+    return fractions.Fraction(wfreq / srate).limit_denominator(maxlen).denominator
+
+@functools.lru_cache(maxsize=WAVE_CACHE_SIZE)
+def get_sine(nsamps, wampl, wfreq, srate):
+    """Cached `mk_sine()`; the array is shared, so it is read-only."""
+    wave = mk_sine(nsamps, wampl, wfreq, srate)
+    wave.flags.writeable = False
+    return wave
 
-def butter_filt(samps, flo, fhi, srate, order = 5):
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def butter_sos(flo, fhi, srate, order = 5):
+    """Band-pass Butterworth design as second order sections (cached).
+
+    The returned array is shared between callers, so it is read-only.
+    """
     nyq = 0.5*srate
-    b, a = sig.butter(order, [flo/nyq, fhi/nyq], btype='band')
-    return sig.lfilter(b, a, samps)
+    sos = sig.butter(order, [flo/nyq, fhi/nyq], btype='band', output='sos')
+    sos.flags.writeable = False
+    return sos
+
+def butter_filt(samps, flo, fhi, srate, order = 5, axis = -1):
+    return sig.sosfilt(butter_sos(flo, fhi, srate, order), samps, axis=axis)
+
+def filter_bank(segs, bands, srate, order = 5):
+    """Band-pass filter each row of `segs` with its (flo, fhi) in `bands`.
+
+    Rows sharing a band are filtered together in one `sosfilt` call.
+    """
+    segs = np.atleast_2d(segs)
+    out = np.empty(segs.shape, dtype=np.result_type(segs, np.float64))
+    bands = [tuple(band) for band in bands]
+    for band in set(bands):
+        rows = [i for i, b in enumerate(bands) if b == band]
+        out[rows] = butter_filt(segs[rows], band[0], band[1], srate, order)
+    return out
+
+def tone_powers(segs, tones, bw, srate):
+    """Power (dB) within `bw` of each row's tone, from one batched FFT.
+
+    Sums the FFT bins of each row of `segs` that lie within bw/2 of its
+    tone, i.e. the band `butter_filt` passes.  Like that filter (it has
+    real coefficients), the mirror band at -tone counts too.
+
+    Tolerance against butter_filt + get_avg_power: within 0.6 dB for a
+    tone 10 dB or more over the noise at 1024 samples, 0.15 dB at 4096;
+    within 1.5 dB on noise alone at 1024 samples.  Most of the difference
+    is the filter's start-up transient, so it shrinks with segment length.
+    """
+    segs = np.atleast_2d(segs)
+    nsamps = segs.shape[-1]
+    spec = np.square(np.abs(scipy.fft.fft(segs, axis=-1)))
+    freqs = np.abs(scipy.fft.fftfreq(nsamps, 1/srate))
+    tones = np.broadcast_to(np.asarray(tones, dtype=np.float64),
+                            segs.shape[:1])
+    inband = np.abs(freqs - tones[:, None]) <= bw/2
+    return 10.0 * np.log10(np.sum(spec * inband, axis=-1) / nsamps**2)
 
-def get_avg_power(samps):
-    return 10.0 * np.log10(np.sum(np.square(np.abs(samps)))/len(samps))
+class PowerMeter:
+    """Band-pass power of a stream of sample chunks, per channel (row).
+
+    Carries the filter state from one chunk to the next and only keeps a
+    running energy sum, so memory use is set by the chunk size, not by
+    the capture length.  Gives the same result as butter_filt() +
+    get_avg_power() over the whole capture.
+    """
+    def __init__(self, flo, fhi, srate, order = 5, nchans = 1):
+        self.sos = butter_sos(flo, fhi, srate, order)
+        self.zi = np.zeros((self.sos.shape[0], nchans, 2),
+                           dtype=np.complex128)
+        self.energy = np.zeros(nchans)
+        self.count = 0
+
+    def feed(self, chunk):
+        (fchunk, self.zi) = sig.sosfilt(self.sos, np.atleast_2d(chunk),
+                                        axis=-1, zi=self.zi)
+        self.energy += np.sum(np.square(np.abs(fchunk)), axis=-1)
+        self.count += fchunk.shape[-1]
+
+    def power(self):
+        # dB, one per channel.
+        return 10.0 * np.log10(self.energy / self.count)
+
+def band_count(srate, bw):
+    # Sub-bands of width ~`bw` that tile the whole sampled band.
+    return max(1, int(round(srate / bw)))
+
+def band_index(freq, nbands, srate):
+    # Sub-band of channelize() (or bin of welch_psd()) holding `freq`.
+    return (nbands // 2 + int(round(freq * nbands / srate))) % nbands
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def channelizer_taps(nbands, ntaps = CHANNELIZER_TAPS):
+    """Channelizer prototype low-pass, in polyphase form (cached).
+
+    Unity DC gain, cut off at half a sub-band; row t holds taps
+    t*nbands .. (t+1)*nbands-1.  Read-only.
+    """
+    proto = sig.firwin(nbands * ntaps, 1 / nbands, window=('kaiser', 8.0))
+    proto = proto.reshape(ntaps, nbands)
+    proto.flags.writeable = False
+    return proto
+
+def channelize(segs, nbands, ntaps = CHANNELIZER_TAPS):
+    """Split each row of `segs` into `nbands` decimated sub-bands.
+
+    Critically sampled polyphase FFT filter bank: returns an array of
+    shape (rows, nbands, nsamps // nbands) holding each sub-band's IQ at
+    srate/nbands, mixed down to 0 Hz.  Sub-bands are in fftshift order
+    (see band_index()).  A tone at a sub-band's centre keeps its
+    amplitude, and white noise its power density, so per-band power
+    matches a band-pass filter of the sub-band's width (but, unlike
+    butter_filt(), without the mirror band).  Samples past the last whole
+    block of `nbands` are left out.
+    """
+    segs = np.atleast_2d(segs)
+    nblocks = segs.shape[-1] // nbands
+    proto = channelizer_taps(nbands, ntaps)
+    proto = proto.astype(np.abs(segs[:1, :1]).dtype, copy=False)
+    # Commutator: blk[m, p] = x[m*nbands - p], zero before the start.
+    idx = np.arange(nblocks)[:, None] * nbands - np.arange(nbands)
+    blk = np.where(idx >= 0, segs[:, np.maximum(idx, 0)], 0)
+    # Polyphase branch filters, one tap (block delay) at a time.
+    acc = blk * proto[0]
+    for t in range(1, min(ntaps, nblocks)):
+        acc[:, t:] += blk[:, :-t] * proto[t]
+    bands = scipy.fft.ifft(acc, axis=-1, norm='forward',
+                           workers=FFT_WORKERS)
+    bands = scipy.fft.fftshift(bands, axes=-1)
+    return np.ascontiguousarray(bands.transpose(0, 2, 1))
+
+def get_avg_power(samps, axis = None):
+    # Mean power in dB; over all samples, or per row/column with `axis`.
+    return 10.0 * np.log10(np.mean(np.square(np.abs(samps)), axis=axis))
+
+@functools.lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def get_window(nfft, name = 'hamming', periodic = False):
+    """Window of length `nfft`, symmetric or periodic (cached, read-only)."""
+    window = sig.get_window(name, nfft, fftbins=periodic)
+    window.flags.writeable = False
+    return window
 
 def compute_psd(nfft, samples):
     """Return the power spectral density of `samples`"""
-    window = np.hamming(nfft)
-    result = np.multiply(window, samples)
-    result = np.fft.fftshift(np.fft.fft(result, nfft))
+    result = np.multiply(get_window(nfft), samples)
+    result = scipy.fft.fftshift(scipy.fft.fft(result, nfft))
     result = np.square(np.abs(result))
     result = np.nan_to_num(10.0 * np.log10(result))
     return result
 
+def welch_psd(segs, nfft, srate, overlap = 0.5, window = 'hann'):
+    """Welch-averaged PSD (dB/Hz, fftshifted) of each row of `segs`.
+
+    Each row is cut into `nfft` long frames overlapping by the `overlap`
+    fraction; all frames of all rows are windowed and transformed in one
+    batched, multi-threaded FFT, then averaged per row.  Samples past the
+    last whole frame are left out.  Frequencies are
+    fftshift(fftfreq(nfft, 1/srate)).
+    """
+    segs = np.atleast_2d(segs)
+    step = max(1, nfft - int(nfft * overlap))
+    win = get_window(nfft, window, periodic=True)
+    frames = np.lib.stride_tricks.sliding_window_view(segs, nfft,
+                                                      axis=-1)[:, ::step]
+    win = win.astype(np.abs(segs[:1, :1]).dtype, copy=False)
+    spec = scipy.fft.fft(frames * win, axis=-1, workers=FFT_WORKERS)
+    psd = np.mean(np.square(np.abs(spec)), axis=1) / \
+        (srate * np.sum(np.square(win)))
+    return np.nan_to_num(10.0 * np.log10(scipy.fft.fftshift(psd, axes=-1)))
+
 def plot_stuff(title, *args):
     plt.suptitle("Client: %s" % title)
     plt.plot(*args)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+#
+# Run a set of simulated measurement clients on this host.  They share one
+# air (see simradio.py) and are named after the sites in the distance
+# data, e.g. cbrssdr1-bes-sim0, cbrssdr1-meb-sim1, ...
+#
+
+import os
+import glob
+import argparse
+import multiprocessing as mp
+
+import meascli
+from clientconnector import DEF_SPOOLDIR
+from simradio import Air
+
+DEF_AIRDIR = "/dev/shm/measair"
+
+def run_node(args, name):
+    cli = meascli.MeasurementsClient(args.host, args.port,
+                                     aionet=args.aionet,
+                                     spooldir=args.spooldir,
+                                     hwtime=args.hwtime, name=name,
+                                     simair=args.airdir)
+    cli.run()
+
+def parse_args():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="Number of simulated clients", default=8, type=int)
+    parser.add_argument("-s", "--host", help="Orchestrator host to connect to", default=meascli.DEF_IP, type=str)
+    parser.add_argument("-p", "--port", help="Orchestrator port", default=meascli.DEF_PORT, type=int)
+    parser.add_argument("--airdir", help="Directory the simulated radios share", default=DEF_AIRDIR, type=str)
+    parser.add_argument("--aionet", help="Use the asyncio connector engine", action="store_true")
+    parser.add_argument("--spooldir", help="Where to spool unacknowledged results", default=DEF_SPOOLDIR, type=str)
+    parser.add_argument("--hwtime", help="Time sequence steps in the (simulated) radio", action="store_true")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.airdir, exist_ok=True)
+    for fname in glob.glob(os.path.join(args.airdir, "*")):
+        os.unlink(fname)
+    sites = sorted(Air().dists)
+    names = ["cbrssdr1-%s-sim%d" % (sites[i % len(sites)], i)
+             for i in range(args.nodes)]
+    procs = [mp.Process(target=run_node, args=(args, name))
+             for name in names]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+#
+# Simulated radio for running clients without hardware.  SimRadio has the
+# same interface as Radio; what it transmits is published to an "air"
+# model, and what it receives is synthesized from the transmissions the
+# air holds for the capture window: path loss from the node distances in
+# data/distance_data.json, a per-link delay and phase, and receiver noise.
+#
+
+import os
+import json
+import time
+import zlib
+import threading
+import collections
+import numpy as np
+
+from bufpool import BufferPool
+
+DEF_DISTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "data", "distance_data.json")
+
+class Air:
+    """In-process air: transmissions of SimRadios sharing this object.
+
+    Each node has at most one (the latest) transmission on the air, kept
+    until the node transmits again so receivers can synthesize a window
+    after it has passed.  Node names are matched to sites in the distance
+    data by their dash-separated components (e.g. "cbrssdr1-bes-comp").
+    """
+    DEF_DISTANCE = 1000     # Meters, between nodes of unknown sites
+    SITE_SPREAD = 100       # Meters of per-link spread added to distances
+    MAX_CLOCK_OFF = 50e-6   # Seconds; per node timing offset
+    NOISE_DBFS = -75.0      # Receiver noise floor
+    GAIN_OFFSET = -24.0     # Puts 38/38 dB gains over 500 m near -40 dBFS
+
+    def __init__(self, distfile = DEF_DISTFILE):
+        self.dists = collections.defaultdict(dict)
+        with open(distfile) as fp:
+            for grp in json.load(fp):
+                site = grp["dsgroup"].rsplit("/", 1)[-1]
+                for ent in grp["entries"]:
+                    self.dists[site].update(ent["attributes"])
+        self.txs = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _seed(*names):
+        # Stable across processes, unlike hash().
+        return zlib.crc32("|".join(names).encode())
+
+    def _site(self, name):
+        for part in name.split("-"):
+            if part in self.dists:
+                return part
+        return None
+
+    def distance(self, txname, rxname):
+        (stx, srx) = (self._site(txname), self._site(rxname))
+        if stx and srx and stx == srx:
+            base = 0
+        elif stx and srx and srx in self.dists[stx]:
+            base = self.dists[stx][srx]
+        else:
+            base = self.DEF_DISTANCE
+        link = "|".join(sorted((txname, rxname)))
+        return base + 1 + self._seed(link) % self.SITE_SPREAD
+
+    def clock_offset(self, name):
+        return (self._seed(name) % 2001 - 1000) / 1000 * self.MAX_CLOCK_OFF
+
+    def path_gain(self, txname, rxname, freq):
+        # Free space path loss, in dB.
+        dist = self.distance(txname, rxname)
+        return -(20 * np.log10(dist) + 20 * np.log10(freq) - 147.55)
+
+    def publish(self, tx, waveform):
+        with self.lock:
+            self.txs[tx["name"]] = (tx, waveform)
+
+    def transmissions(self, exclude):
+        with self.lock:
+            return [val for name, val in self.txs.items() if name != exclude]
+
+    def receive(self, rxname, freq, rate, gain, start, out):
+        """Synthesize what `rxname` hears over `out.shape[-1]` samples.
+
+        Each row of `out` is a separate RX channel (antenna): same path
+        loss, but its own phase and noise.
+        """
+        (nchans, nsamps) = out.shape
+        rng = np.random.default_rng()
+        namp = 10 ** ((self.NOISE_DBFS - 3) / 20)
+        out[:] = namp * (rng.standard_normal(out.shape) +
+                         1j * rng.standard_normal(out.shape))
+        rxstart = start + self.clock_offset(rxname)
+        for (tx, wave) in self.transmissions(rxname):
+            foff = tx["freq"] - freq
+            if tx["rate"] != rate or abs(foff) >= rate / 2:
+                continue
+            delay = self.distance(tx["name"], rxname) / 3e8
+            offset = rxstart - (tx["start"] + self.clock_offset(tx["name"]) +
+                                delay)
+            idx = int(round(offset * rate)) + np.arange(nsamps)
+            valid = (idx >= 0) & (idx < (tx["end"] - tx["start"]) * rate)
+            if tx["periodic"]:
+                idx %= wave.shape[-1]
+            else:
+                valid &= idx < wave.shape[-1]
+            if not valid.any():
+                continue
+            idx = idx[valid]
+            dbgain = tx["gain"] + gain + self.GAIN_OFFSET + \
+                self.path_gain(tx["name"], rxname, freq)
+            sig = 10 ** (dbgain / 20) * wave[0, idx] * \
+                np.exp(2j * np.pi * foff * idx / rate)
+            link = "|".join(sorted((tx["name"], rxname)))
+            for chan in range(nchans):
+                phase = 2 * np.pi * (self._seed(link, str(chan)) % 360) / 360
+                out[chan, valid] += sig * np.exp(1j * phase)
+
+
+class DirAir(Air):
+    """Air shared between processes through files in `airdir`.
+
+    Each transmitter replaces its own `<name>.tx` (JSON) and `<name>.npy`
+    (waveform) files; receivers map the waveforms read-only.  Put `airdir`
+    on a tmpfs such as /dev/shm.
+    """
+    def __init__(self, airdir, distfile = DEF_DISTFILE):
+        super().__init__(distfile)
+        self.airdir = airdir
+        os.makedirs(airdir, exist_ok=True)
+
+    def _path(self, name, ext):
+        return os.path.join(self.airdir, "%s.%s" % (name, ext))
+
+    def publish(self, tx, waveform):
+        # Write then rename, so readers never see a partial file.  The
+        # waveform goes first; its name is in the descriptor.
+        name = tx["name"]
+        tx["wavefile"] = self._path("%s-%d" % (name, tx["seq"]), "npy")
+        np.save(tx["wavefile"] + ".tmp", waveform)
+        os.replace(tx["wavefile"] + ".tmp.npy", tx["wavefile"])
+        with open(self._path(name, "tx.tmp"), "w") as fp:
+            json.dump(tx, fp)
+        os.replace(self._path(name, "tx.tmp"), self._path(name, "tx"))
+        # The previous waveform may still be mapped by a reader; unlinking
+        # is safe for them.
+        old = self._path("%s-%d" % (name, tx["seq"] - 1), "npy")
+        if os.path.exists(old):
+            os.unlink(old)
+
+    def transmissions(self, exclude):
+        txs = []
+        for fname in os.listdir(self.airdir):
+            if not fname.endswith(".tx") or fname[:-3] == exclude:
+                continue
+            try:
+                with open(os.path.join(self.airdir, fname)) as fp:
+                    tx = json.load(fp)
+                txs.append((tx, np.load(tx["wavefile"], mmap_mode="r")))
+            except (OSError, ValueError):
+                continue  # Replaced under us; it's a newer transmission.
+        return txs
+
+
+class SimRadio:
+    """Radio stand-in that transmits into and receives from an `Air`.
+
+    Calls take as long as the real thing would (captures end after their
+    last sample "arrives"), and times are host times, so `sync_time()` is
+    a no-op.
+    """
+    def __init__(self, logger, name, air, *args, **kwargs):
+        self.logger = logger
+        self.name = name
+        self.air = air
+        self.freq = 0
+        self.gain = 0
+        self.rate = 1e6
+        self.seq = 0
+        self.rxchans = [0]
+        self.timesynced = False
+        self.pool = BufferPool()
+        self.txthread = None
+        self.txstop = threading.Event()
+        self.txstats = collections.Counter()
+
+    def sync_time(self, pps = False):
+        self.timesynced = True
+
+    def tune(self, freq, gain, rate = None):
+        self.freq = freq
+        self.gain = gain
+        if rate:
+            self.rate = rate
+
+    def set_rx_channels(self, chans):
+        self.rxchans = list(chans)
+
+    def release(self, samples):
+        self.pool.put(samples)
+
+    def recv_samples(self, nsamps, rate = None, start_time = None,
+                     out = None):
+        if rate:
+            self.rate = rate
+        samples = out if out is not None else \
+            self.pool.get((len(self.rxchans), nsamps))
+        start = time.time()
+        if start_time and self.timesynced and start_time > start:
+            start = start_time
+        end = start + nsamps / self.rate
+        time.sleep(max(0, end - time.time()))
+        self.air.receive(self.name, self.freq, self.rate, self.gain, start,
+                         samples)
+        return samples
+
+    def recv_chunks(self, nsamps, chunk, rate = None, start_time = None):
+        if rate:
+            self.rate = rate
+        buf = self.pool.get((len(self.rxchans), chunk))
+        start = time.time()
+        if start_time and self.timesynced and start_time > start:
+            start = start_time
+        try:
+            for offset in range(0, nsamps, chunk):
+                view = buf[:, :min(chunk, nsamps - offset)]
+                cstart = start + offset / self.rate
+                time.sleep(max(0, cstart + view.shape[-1] / self.rate -
+                               time.time()))
+                self.air.receive(self.name, self.freq, self.rate, self.gain,
+                                 cstart, view)
+                yield view
+        finally:
+            self.pool.put(buf)
+
+    def _publish(self, waveform, start, end, periodic):
+        self.seq += 1
+        tx = {"name": self.name, "seq": self.seq, "freq": self.freq,
+              "rate": self.rate, "gain": self.gain, "start": start,
+              "end": end, "periodic": periodic}
+        self.air.publish(tx, np.ascontiguousarray(waveform,
+                                                  dtype=np.complex64))
+
+    def _start(self, start_time):
+        now = time.time()
+        if start_time and self.timesynced and start_time > now:
+            return start_time
+        return now
+
+    def send_samples(self, samples, rate = None, start_time = None):
+        if rate:
+            self.rate = rate
+        start = self._start(start_time)
+        end = start + samples.shape[-1] / self.rate
+        self._publish(samples, start, end, False)
+        time.sleep(max(0, end - time.time()))
+
+    def _txstream_wait(self, start, end_time):
+        self.txstop.wait(None if end_time is None else
+                         max(0, end_time - time.time()))
+        self.txstats["tx_samples"] += int((time.time() - start) * self.rate)
+
+    def start_txstream(self, waveform, end_time = None, start_time = None):
+        self.stop_txstream()
+        self.txstop.clear()
+        self.txstats = collections.Counter(tx_samples=0, tx_underflows=0,
+                                           tx_seq_errors=0, tx_time_errors=0)
+        start = self._start(start_time)
+        self._publish(waveform, start, end_time or float("inf"), True)
+        self.txthread = threading.Thread(target=self._txstream_wait,
+                                         args=(start, end_time), daemon=True)
+        self.txthread.start()
+
+    def wait_txstream(self):
+        if self.txthread:
+            self.txthread.join()
+            self.txthread = None
+        return dict(self.txstats)
+
+    def stop_txstream(self):
+        self.txstop.set()
+        return self.wait_txstream()
+
+    def cancel(self):
+        """Cut a running TX stream short; safe to call from any thread."""
+        self.txstop.set()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# On-disk spool for results that the server hasn't acknowledged yet.
+#
+
+import os
+import struct
+import collections
+
+import measurements_pb2 as measpb
+from framing import HDR_FMT, HDR_LEN, pack_frame
+
+def result_key(msg):
+    # Every step of a sequence call is a result of its own.
+    return (msg.uuid, msg.step)
+
+def mk_ack(msg):
+    # ACK carries the key fields of the result it acknowledges.
+    ack = measpb.SessionMsg()
+    ack.type = measpb.SessionMsg.ACK
+    ack.uuid = msg.uuid
+    ack.step = msg.step
+    return ack
+
+class ResultSpool:
+    """Append-only file of framed RESULT messages awaiting an ACK.
+
+    Each result is appended before it is sent; an ACK appends a small
+    tombstone record.  Loading the file replays both, so results survive
+    disconnects as well as connector restarts.  Only file offsets of the
+    pending frames are kept in memory, and the file is truncated whenever
+    nothing is pending.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pending = collections.OrderedDict()
+        self._load()
+        self.fp = open(path, "ab")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as fp:
+            data = fp.read()
+        pos = 0
+        while len(data) - pos >= HDR_LEN:
+            mlen = struct.unpack_from(HDR_FMT, data, pos)[0]
+            end = pos + HDR_LEN + mlen
+            if end > len(data):
+                break  # Torn write at the tail; drop it.
+            msg = measpb.SessionMsg()
+            msg.ParseFromString(data[pos + HDR_LEN:end])
+            if msg.type == measpb.SessionMsg.ACK:
+                self.pending.pop(result_key(msg), None)
+            else:
+                self.pending[result_key(msg)] = (pos, end - pos)
+            pos = end
+        if pos < len(data):
+            os.truncate(self.path, pos)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, msg):
+        # Returns the frame to send.
+        frame = pack_frame(msg)
+        self.fp.seek(0, os.SEEK_END)
+        self.pending[result_key(msg)] = (self.fp.tell(), len(frame))
+        self.fp.write(frame)
+        self.fp.flush()
+        return frame
+
+    def ack(self, msg):
+        key = result_key(msg)
+        if self.pending.pop(key, None) is None:
+            return
+        if not self.pending:
+            self.fp.truncate(0)
+            return
+        self.fp.write(pack_frame(mk_ack(msg)))
+        self.fp.flush()
+
+    def frames(self):
+        with open(self.path, "rb") as fp:
+            for (offset, flen) in list(self.pending.values()):
+                fp.seek(offset)
+                yield fp.read(flen)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+#
+# Check that Radio hands timed receives and transmits to the device with
+# time specs (and issues late ones right away), using the uhd stub:
+#
+#   python3 stubs/check_timespecs.py
+#
+
+import os
+import sys
+import logging
+import numpy as np
+
+STUBDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [STUBDIR, os.path.dirname(STUBDIR)]
+
+import uhd
+from radio import Radio
+
+LEAD = 0.2  # How far ahead to schedule the timed calls.
+
+def issued(name):
+    return [entry[1:] for entry in uhd.ISSUED if entry[0] == name]
+
+def check_recv(radio, nsamps):
+    del uhd.ISSUED[:]
+    start = radio.usrp.get_time_now().get_real_secs() + LEAD
+    samples = radio.recv_samples(nsamps, start_time=start)
+    assert samples.shape[-1] == nsamps
+    (mode, count, now, secs) = issued("rx_stream_cmd")[-1]
+    assert mode == uhd.types.StreamMode.num_done and count == nsamps
+    assert now is False, "timed receive issued with stream_now"
+    assert secs == start, "receive time spec %f != %f" % (secs, start)
+
+    # Too late to schedule: issued right away.
+    del uhd.ISSUED[:]
+    radio.recv_samples(nsamps, start_time=start - 1)
+    (mode, count, now, secs) = issued("rx_stream_cmd")[-1]
+    assert now is True, "late receive not issued with stream_now"
+
+def check_send(radio, nsamps):
+    samples = np.ones((1, nsamps), dtype=np.complex64)
+    del uhd.ISSUED[:]
+    start = radio.usrp.get_time_now().get_real_secs() + LEAD
+    radio.send_samples(samples, start_time=start)
+    (count, sob, eob, timed, secs) = issued("tx_send")[0]
+    assert sob, "first send is not a start of burst"
+    assert timed, "timed send has no time spec"
+    assert secs == start, "send time spec %f != %f" % (secs, start)
+    assert not any(entry[3] for entry in issued("tx_send")[1:]), \
+        "time spec on a send after the first"
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    radio = Radio(logging.getLogger())
+    radio.sync_time()
+    check_recv(radio, 10500)
+    check_send(radio, 10500)
+    print("OK")
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+#
+# Minimal stand-in for the UHD python module, covering the parts of the API
+# used by radio.py.  Every setter, stream command and time spec is
+# appended to `ISSUED` so behaviour can be checked without hardware, e.g.:
+#
+#   PYTHONPATH=stubs ./meascli.py --hwtime
+#
+# check_timespecs.py uses it to check Radio's timed receives and sends.
+#
+
+import time
+import types as _types
+import enum
+import numpy as np
+
+ISSUED = []
+REALTIME = False  # Pace streamers at the configured sample rate.
+
+def _log(*entry):
+    ISSUED.append(entry)
+
+
+class TimeSpec:
+    def __init__(self, secs = 0.0):
+        self.secs = float(secs)
+
+    def get_real_secs(self):
+        return self.secs
+
+    def __repr__(self):
+        return "TimeSpec(%f)" % self.secs
+
+
+class StreamMode(enum.Enum):
+    start_cont = 0
+    stop_cont = 1
+    num_done = 2
+    num_more = 3
+
+
+class StreamCMD:
+    def __init__(self, mode):
+        self.stream_mode = mode
+        self.num_samps = 0
+        self.stream_now = True
+        self.time_spec = TimeSpec()
+
+
+class RXMetadataErrorCode(enum.Enum):
+    none = 0
+    timeout = 1
+    late = 2
+    broken_chain = 3
+    overflow = 4
+    alignment = 5
+    bad_packet = 6
+
+
+class RXMetadata:
+    def __init__(self):
+        self.error_code = RXMetadataErrorCode.none
+        self.has_time_spec = False
+        self.time_spec = TimeSpec()
+        self.start_of_burst = False
+        self.end_of_burst = False
+
+    def strerror(self):
+        return "ERROR_CODE_%s" % self.error_code.name.upper()
+
+
+class TXMetadata:
+    def __init__(self):
+        self.has_time_spec = False
+        self.time_spec = TimeSpec()
+        self.start_of_burst = False
+        self.end_of_burst = False
+
+
+class TXMetadataEventCode(enum.Enum):
+    burst_ack = 1
+    underflow = 2
+    seq_error = 4
+    time_error = 8
+    underflow_in_packet = 16
+    seq_error_in_packet = 32
+
+
+class TXAsyncMetadata:
+    def __init__(self):
+        self.channel = 0
+        self.has_time_spec = False
+        self.time_spec = TimeSpec()
+        self.event_code = TXMetadataEventCode.burst_ack
+
+
+class TuneRequest:
+    def __init__(self, target_freq, lo_off = 0.0):
+        self.target_freq = target_freq
+        self.lo_off = lo_off
+
+
+types = _types.SimpleNamespace(
+    TimeSpec=TimeSpec, StreamMode=StreamMode, StreamCMD=StreamCMD,
+    RXMetadataErrorCode=RXMetadataErrorCode, RXMetadata=RXMetadata,
+    TXMetadata=TXMetadata, TXMetadataEventCode=TXMetadataEventCode,
+    TXAsyncMetadata=TXAsyncMetadata, TuneRequest=TuneRequest)
+
+
+class StreamArgs:
+    def __init__(self, cpu_format, otw_format):
+        self.cpu_format = cpu_format
+        self.otw_format = otw_format
+        self.channels = [0]
+
+
+class RXStreamer:
+    MAX_SAMPS = 2000
+
+    def __init__(self, usrp, channels):
+        self.usrp = usrp
+        self.channels = list(channels)
+        self.remaining = 0
+        self.continuous = False
+        self.next_time = None
+
+    def get_max_num_samps(self):
+        return self.MAX_SAMPS
+
+    def get_num_channels(self):
+        return len(self.channels)
+
+    def issue_stream_cmd(self, cmd):
+        _log("rx_stream_cmd", cmd.stream_mode, cmd.num_samps, cmd.stream_now,
+             cmd.time_spec.get_real_secs())
+        if cmd.stream_mode == StreamMode.stop_cont:
+            self.continuous = False
+            self.remaining = 0
+            return
+        self.continuous = cmd.stream_mode == StreamMode.start_cont
+        self.remaining = cmd.num_samps
+        if cmd.stream_now:
+            self.next_time = self.usrp.get_time_now().get_real_secs()
+        else:
+            self.next_time = cmd.time_spec.get_real_secs()
+
+    def recv(self, buf, md, timeout = 0.1):
+        # The real binding silently receives into a temporary copy of a
+        # non-contiguous array; fail loudly instead.
+        if not buf.flags.c_contiguous:
+            raise ValueError("recv buffer is not C-contiguous")
+        md.error_code = RXMetadataErrorCode.none
+        if not self.continuous and self.remaining <= 0:
+            md.error_code = RXMetadataErrorCode.timeout
+            return 0
+        rate = self.usrp.get_rx_rate(self.channels[0])
+        wait = self.next_time - self.usrp.get_time_now().get_real_secs()
+        if wait > timeout:
+            time.sleep(timeout)
+            md.error_code = RXMetadataErrorCode.timeout
+            return 0
+        nsamps = min(buf.shape[-1], self.MAX_SAMPS)
+        if not self.continuous:
+            nsamps = min(nsamps, self.remaining)
+            self.remaining -= nsamps
+        if REALTIME:
+            lag = self.next_time + nsamps/rate - \
+                self.usrp.get_time_now().get_real_secs()
+            if lag > 0:
+                time.sleep(lag)
+        elif wait > 0:
+            time.sleep(wait)
+        t = np.arange(nsamps) / rate + self.next_time
+        for i, chan in enumerate(self.channels):
+            tone = self.usrp.rx_tone[chan] if chan in self.usrp.rx_tone else 1e5
+            buf[i, :nsamps] = (0.1 * np.exp(2j*np.pi*tone*t) +
+                               0.01 * (np.random.randn(nsamps) +
+                                       1j*np.random.randn(nsamps)))
+        md.has_time_spec = True
+        md.time_spec = TimeSpec(self.next_time)
+        self.next_time += nsamps / rate
+        return nsamps
+
+
+class TXStreamer:
+    MAX_SAMPS = 2000
+
+    def __init__(self, usrp, channels):
+        self.usrp = usrp
+        self.channels = list(channels)
+        self.events = []
+        self.sent = 0
+
+    def get_max_num_samps(self):
+        return self.MAX_SAMPS
+
+    def get_num_channels(self):
+        return len(self.channels)
+
+    def send(self, buf, md, timeout = 0.1):
+        nsamps = buf.shape[-1]
+        if md.start_of_burst or md.end_of_burst or md.has_time_spec:
+            _log("tx_send", nsamps, md.start_of_burst, md.end_of_burst,
+                 md.has_time_spec, md.time_spec.get_real_secs())
+        if REALTIME and nsamps:
+            time.sleep(nsamps / self.usrp.get_tx_rate(self.channels[0]))
+        self.sent += nsamps
+        if md.end_of_burst:
+            self.events.append(TXMetadataEventCode.burst_ack)
+        return nsamps
+
+    def recv_async_msg(self, md, timeout = 0.1):
+        if self.events:
+            md.event_code = self.events.pop(0)
+            return True
+        time.sleep(min(timeout, 0.01))
+        return False
+
+
+class MultiUSRP:
+    def __init__(self, args = ""):
+        _log("MultiUSRP", args)
+        self.args = args
+        self.rates = {"rx": {}, "tx": {}}
+        self.rx_tone = {}
+        self.time_offset = 0.0
+
+    def _set(self, name, value, chan):
+        _log(name, value, chan)
+
+    def set_rx_antenna(self, ant, chan = 0):
+        self._set("set_rx_antenna", ant, chan)
+
+    def set_rx_freq(self, req, chan = 0):
+        self._set("set_rx_freq", req.target_freq, chan)
+
+    def set_tx_freq(self, req, chan = 0):
+        self._set("set_tx_freq", req.target_freq, chan)
+
+    def set_rx_gain(self, gain, chan = 0):
+        self._set("set_rx_gain", gain, chan)
+
+    def set_tx_gain(self, gain, chan = 0):
+        self._set("set_tx_gain", gain, chan)
+
+    def set_rx_rate(self, rate, chan = 0):
+        self._set("set_rx_rate", rate, chan)
+        self.rates["rx"][chan] = rate
+
+    def set_tx_rate(self, rate, chan = 0):
+        self._set("set_tx_rate", rate, chan)
+        self.rates["tx"][chan] = rate
+
+    def get_rx_rate(self, chan = 0):
+        return self.rates["rx"].get(chan, 1e6)
+
+    def get_tx_rate(self, chan = 0):
+        return self.rates["tx"].get(chan, 1e6)
+
+    def get_rx_num_channels(self):
+        return 2
+
+    def get_time_now(self, mboard = 0):
+        return TimeSpec(time.time() + self.time_offset)
+
+    def set_time_now(self, spec, mboard = 0):
+        _log("set_time_now", spec.get_real_secs())
+        self.time_offset = spec.get_real_secs() - time.time()
+
+    def set_time_next_pps(self, spec, mboard = 0):
+        _log("set_time_next_pps", spec.get_real_secs())
+        self.time_offset = spec.get_real_secs() - np.ceil(time.time())
+
+    def get_time_last_pps(self, mboard = 0):
+        return TimeSpec(np.floor(time.time()) + self.time_offset)
+
+    def get_rx_stream(self, st_args):
+        return RXStreamer(self, st_args.channels)
+
+    def get_tx_stream(self, st_args):
+        return TXStreamer(self, st_args.channels)
+
+
+usrp = _types.SimpleNamespace(MultiUSRP=MultiUSRP, StreamArgs=StreamArgs)